@@ -1,15 +1,23 @@
 import os
+import uuid
 import streamlit as st
 import pandas as pd
-from vnstock import Vnstock, Listing
-from vnstock.core.utils.transform import flatten_hierarchical_index
+from vnstock import Listing
 import warnings
 
 # pandasai v2.4.2 imports
 from pandasai import Agent
-from pandasai.llm import OpenAI
-import glob
 
+from core import (
+    DEFAULT_CHART_DIR,
+    SAMPLE_QUESTIONS,
+    get_generated_code,
+    load_financial_data,
+)
+from model_router import create_llm, get_model_router
+from screener import ScreenerError, get_universe, screen
+from upstream import get_upstream_client
+from session_memory import get_session_memory, track_current_session
 
 from vnstock import register_user
 
@@ -29,33 +37,6 @@ if _vnstock_api_key:
         # Silently fail if registration doesn't work - vnstock will work in free tier
         pass
 
-# Sample questions for AI analysis (inlined from src.core.config)
-SAMPLE_QUESTIONS = [
-    "Calculate EPS growth in 2024 and compare to the Net Profit Margin percentage in 2024? Convert the Net Profit Margin from decimal to percentage. Answer by concluding whether EPS growth is tracking ahead or behind profitability",
-    "Analyze the dividend yield trend",
-    "What is the company's debt-to-equity ratio?",
-    "What's 2024 revenue growth?",
-    "What's the ROE in 2024?",
-    "Plot a line chart of OCF and Sales over the years?",
-    "What is the company's profitability trend?",
-    "Analyze the balance sheet health indicators",
-]
-
-
-# Helper function to detect latest chart (inlined from src.services.chart_service)
-def detect_latest_chart():
-    """Detect the most recently generated chart file"""
-    try:
-        chart_dir = "exports/charts/"
-        if os.path.exists(chart_dir):
-            chart_files = glob.glob(os.path.join(chart_dir, "*.png"))
-            if chart_files:
-                latest_chart = max(chart_files, key=os.path.getctime)
-                return {"type": "image", "path": latest_chart}
-    except Exception:
-        pass
-    return None
-
 
 # Helper function to inject custom success styling (inlined from src.components.ui_components)
 def inject_custom_success_styling():
@@ -94,48 +75,21 @@ div[data-testid="stAlert"] p {
 """)
 
 
-# Helper function to extract generated code from PandasAI response/agent
-def get_generated_code(response, agent):
-    """Extract generated code from PandasAI response or agent object"""
-    try:
-        # Try response object first
-        if hasattr(response, "last_code_executed") and response.last_code_executed:
-            return response.last_code_executed
-
-        # Try agent object
-        if hasattr(agent, "last_code_executed") and agent.last_code_executed:
-            return agent.last_code_executed
-
-        # Try agent's memory or context
-        if hasattr(agent, "memory") and hasattr(agent.memory, "get_last_code"):
-            code = agent.memory.get_last_code()
-            if code:
-                return code
-
-        # Try to find code in agent's internal state
-        for attr_name in ["_last_code_generated", "_code_executed", "last_code"]:
-            if hasattr(agent, attr_name):
-                code = getattr(agent, attr_name)
-                if code and isinstance(code, str) and len(code.strip()) > 5:
-                    return code
-
-        return "# Code generation details not available"
-
-    except Exception as e:
-        return f"# Error accessing code: {str(e)}"
-
-
-def process_agent_response(agent, question):
+def process_agent_response(get_agent, question):
     """Process agent response and return formatted message data"""
     try:
         with st.spinner("🤖 Analyzing..."):
-            response = agent.chat(question)
+            # Route the question to a model, escalating if the answer fails
+            result = get_model_router().run(
+                question, get_agent, chart_dir=st.session_state.chart_dir
+            )
+            response = result["response"]
 
             # Get the generated code
-            generated_code = get_generated_code(response, agent)
+            generated_code = get_generated_code(response, result["agent"])
 
-            # Detect chart
-            chart_data = detect_latest_chart()
+            # Chart generated while answering, if any
+            chart_data = result["chart_data"]
 
             # Create message data
             message_data = {"role": "assistant", "content": str(response)}
@@ -250,6 +204,9 @@ st.set_page_config(
 # Apply custom CSS styling for success alerts
 inject_custom_success_styling()
 
+# Account this session's memory, restoring it if it was spilled while idle
+track_current_session()
+
 # Initialize session state variables for standalone mode
 if "stock_symbol" not in st.session_state:
     st.session_state.stock_symbol = None
@@ -259,6 +216,10 @@ if "display_dataframes" not in st.session_state:
     st.session_state.display_dataframes = None
 if "messages" not in st.session_state:
     st.session_state.messages = []
+if "chart_dir" not in st.session_state:
+    # Charts of each session go to their own directory, so one tab's chart is
+    # never attached to another tab's answer
+    st.session_state.chart_dir = os.path.join(DEFAULT_CHART_DIR, uuid.uuid4().hex)
 
 # Standalone stock symbol selection (replaces session state dependency)
 st.header("🤖 AI Chat Analysis")
@@ -272,7 +233,9 @@ with st.sidebar:
     if "stock_symbols_list" not in st.session_state:
         try:
             with st.spinner("Loading stock symbols..."):
-                symbols_df = Listing().all_symbols()
+                symbols_df = get_upstream_client().call(
+                    ("all_symbols",), lambda: Listing().all_symbols()
+                )
                 st.session_state.stock_symbols_list = sorted(
                     symbols_df["symbol"].tolist()
                 )
@@ -359,6 +322,44 @@ with st.sidebar:
         # Store the selected question for processing
         st.session_state.pending_question = selected_question
 
+    # Universe screener over locally cached fundamentals
+    st.markdown("---")
+    st.subheader("Screener")
+
+    screener_filter = st.text_input(
+        "Filter:",
+        placeholder="roe > 0.18 and falling(debt_equity, 3)",
+        help="Screens every company with cached ratios. Ratios are decimals "
+        "(18% is 0.18). Functions: lag, change, growth, mean, rising, falling. "
+        'Industry: industry == "Banks"',
+    )
+    screener_rank = st.text_input("Rank by:", placeholder="roe")
+
+    if screener_filter and st.button("Run Screener", use_container_width=True):
+        try:
+            universe = get_universe(period)
+            screener_result = screen(
+                universe, screener_filter, screener_rank or None
+            )
+            st.dataframe(screener_result, hide_index=True)
+
+            # Make the results available to the AI analyst
+            if "uploaded_dataframes" not in st.session_state:
+                st.session_state.uploaded_dataframes = []
+            st.session_state.uploaded_dataframes.append(screener_result)
+            matched = ", ".join(screener_result["symbol"].tolist())
+            st.session_state.messages.append(
+                {
+                    "role": "assistant",
+                    "content": f"🔎 Screener `{screener_filter}` matched "
+                    f"{len(screener_result)} of {len(universe.symbols)} cached "
+                    f"companies: {matched or 'none'}. The results table is "
+                    "available for analysis.",
+                }
+            )
+        except ScreenerError as e:
+            st.error(f"❌ {str(e)}")
+
     # Clear Chat button in sidebar
     st.sidebar.markdown("---")
 
@@ -374,6 +375,38 @@ with st.sidebar:
         except Exception:
             st.write("**Theme unavailable**")
 
+    # Shared vnstock request pacing across all sessions
+    with st.sidebar.expander("📡 Data API Status", expanded=False):
+        upstream_stats = get_upstream_client().stats()
+        st.write(
+            f"**Rate:** {upstream_stats['rate_per_minute']}"
+            f"/{upstream_stats['limit_per_minute']} requests/min"
+        )
+        st.write(f"**Queue depth:** {upstream_stats['queue_depth']}")
+        st.write(f"**In flight:** {upstream_stats['in_flight']}")
+        st.write(f"**Coalesced:** {upstream_stats['coalesced']}")
+        st.write(f"**Throttled:** {upstream_stats['throttled']}")
+        st.write(f"**Retries:** {upstream_stats['retries']}")
+
+    # Session memory across all browser tabs served by this process
+    with st.sidebar.expander("🧠 Memory", expanded=False):
+        memory_stats = get_session_memory().stats()
+        st.write(
+            f"**Resident:** {memory_stats['resident_mb']}"
+            f"/{memory_stats['budget_mb']} MB"
+        )
+        st.write(f"**Resident sessions:** {memory_stats['resident_sessions']}")
+        st.write(f"**Spilled sessions:** {memory_stats['spilled_sessions']}")
+        st.write(f"**Evictions:** {memory_stats['evictions']}")
+
+    # Per route and model latency and success rates
+    with st.sidebar.expander("🧭 Model Routing", expanded=False):
+        routing_stats = get_model_router().stats()
+        if routing_stats:
+            st.dataframe(pd.DataFrame(routing_stats), hide_index=True)
+        else:
+            st.write("No questions routed yet")
+
     if st.button("Clear Chat", use_container_width=True, key="sidebar_clear_chat"):
         st.session_state.messages = []
         st.rerun()
@@ -395,103 +428,18 @@ if analyze_button or (
 ):
     try:
         with st.spinner(f"Loading data for {stock_symbol}..."):
-            # Initialize Vnstock
-            stock = Vnstock().stock(symbol=stock_symbol, source=source)
-            company = (
-                Vnstock().stock(symbol=stock_symbol, source=company_source).company
-            )
-
-            # Load financial data
-            CashFlow = stock.finance.cash_flow(period=period)
-            BalanceSheet = stock.finance.balance_sheet(
-                period=period, lang="en", dropna=True
-            )
-            IncomeStatement = stock.finance.income_statement(
-                period=period, lang="en", dropna=True
-            )
-
-            # Load and process Ratio data (multi-index columns)
-            Ratio_raw = stock.finance.ratio(period=period, lang="en", dropna=True)
-
-            # Use vnstock's built-in flatten_hierarchical_index function
-            Ratio = flatten_hierarchical_index(
-                Ratio_raw, separator="_", handle_duplicates=True, drop_levels=0
+            display_dataframes, ai_dataframes = load_financial_data(
+                stock_symbol, period, source, company_source
             )
 
-            dividend_schedule = pd.DataFrame()
-
             # Store original dataframes for display (keep original column names)
-            st.session_state.display_dataframes = {
-                "CashFlow": CashFlow,
-                "BalanceSheet": BalanceSheet,
-                "IncomeStatement": IncomeStatement,
-                "Ratios": Ratio,
-                "Dividends": dividend_schedule,
-            }
-
-            # Create copies with renamed columns for PandasAI (better query compatibility)
-            CashFlow_AI = CashFlow.copy()
-            BalanceSheet_AI = BalanceSheet.copy()
-            IncomeStatement_AI = IncomeStatement.copy()
-            Ratio_AI = Ratio.copy()
-
-            # Sort all financial statements by yearReport in ascending order for proper temporal alignment
-            if not CashFlow_AI.empty and "yearReport" in CashFlow_AI.columns:
-                CashFlow_AI = CashFlow_AI.sort_values("yearReport", ascending=True)
-            if not BalanceSheet_AI.empty and "yearReport" in BalanceSheet_AI.columns:
-                BalanceSheet_AI = BalanceSheet_AI.sort_values(
-                    "yearReport", ascending=True
-                )
-            if (
-                not IncomeStatement_AI.empty
-                and "yearReport" in IncomeStatement_AI.columns
-            ):
-                IncomeStatement_AI = IncomeStatement_AI.sort_values(
-                    "yearReport", ascending=True
-                )
-            if not Ratio_AI.empty and "yearReport" in Ratio_AI.columns:
-                Ratio_AI = Ratio_AI.sort_values("yearReport", ascending=True)
-
-            if period == "quarter":
-                # Rename columns in AI copies for better query compatibility
-                if (
-                    "lengthReport" in CashFlow_AI.columns
-                    and CashFlow_AI["lengthReport"].isin([1, 2, 3, 4]).any()
-                ):
-                    CashFlow_AI = CashFlow_AI.rename(
-                        columns={"lengthReport": "Quarter"}
-                    )
-
-                if (
-                    "lengthReport" in BalanceSheet_AI.columns
-                    and BalanceSheet_AI["lengthReport"].isin([1, 2, 3, 4]).any()
-                ):
-                    BalanceSheet_AI = BalanceSheet_AI.rename(
-                        columns={"lengthReport": "Quarter"}
-                    )
-
-                if (
-                    "lengthReport" in IncomeStatement_AI.columns
-                    and IncomeStatement_AI["lengthReport"].isin([1, 2, 3, 4]).any()
-                ):
-                    IncomeStatement_AI = IncomeStatement_AI.rename(
-                        columns={"lengthReport": "Quarter"}
-                    )
-
-                if (
-                    "lengthReport" in Ratio_AI.columns
-                    and Ratio_AI["lengthReport"].isin([1, 2, 3, 4]).any()
-                ):
-                    Ratio_AI = Ratio_AI.rename(columns={"lengthReport": "Quarter"})
+            st.session_state.display_dataframes = display_dataframes
 
             # Store AI-optimized dataframes for PandasAI
-            st.session_state.dataframes = {
-                "CashFlow": CashFlow_AI,
-                "BalanceSheet": BalanceSheet_AI,
-                "IncomeStatement": IncomeStatement_AI,
-                "Ratios": Ratio_AI,
-                "Dividends": dividend_schedule,
-            }
+            st.session_state.dataframes = ai_dataframes
+
+            # Account for the newly loaded data before the session goes idle
+            track_current_session()
 
             st.session_state.stock_symbol = stock_symbol
             st.session_state.last_period = (
@@ -519,18 +467,18 @@ if "dataframes" in st.session_state:
 
     st.header(company_name)
 
-    # Initialize LLM with OpenAI for pandasai v2.4.2
-    model = os.environ.get("OPENAI_MODEL", "gpt-4o-mini")
-    llm = OpenAI(api_token=st.session_state.api_key, model=model)
+    # Default model; questions are routed between the configured models
+    default_model = get_model_router().default_model
 
     # Initialize session state for uploaded files if not exists
     if "uploaded_dataframes" not in st.session_state:
         st.session_state.uploaded_dataframes = []
 
-    def get_or_create_agent():
+    def get_or_create_agent(model=default_model):
         """
-        Creates or retrieves cached PandasAI agent with all available dataframes.
-        Only recreates when dataframes have changed.
+        Creates or retrieves the cached PandasAI agent with all available
+        dataframes and switches it to the given model. Only recreates when
+        dataframes have changed, so the conversation is shared by all models.
         """
         # Create unique key based on current dataframes
         stock_df_count = (
@@ -542,13 +490,24 @@ if "dataframes" in st.session_state:
         uploaded_df_count = len(st.session_state.uploaded_dataframes)
         current_key = f"agent_{stock_df_count}_{uploaded_df_count}"
 
+        # One LLM per API key and model, reused when the agent is recreated
+        llm_key = (st.session_state.api_key, model)
+        if "llms" not in st.session_state:
+            st.session_state.llms = {}
+        if llm_key not in st.session_state.llms:
+            st.session_state.llms[llm_key] = create_llm(*llm_key)
+        llm = st.session_state.llms[llm_key]
+
         # Check if agent exists and is up to date
         if (
             "agent" in st.session_state
             and "agent_key" in st.session_state
             and st.session_state.agent_key == current_key
         ):
-            return st.session_state.agent
+            agent = st.session_state.agent
+            # Agent reads the LLM from its config on every call
+            agent.config.llm = llm
+            return agent
 
         # Create new agent with all dataframes
         all_dataframes = []
@@ -559,7 +518,16 @@ if "dataframes" in st.session_state:
         if not all_dataframes:
             return None
 
-        agent = Agent(all_dataframes, config={"llm": llm, "verbose": True})
+        agent = Agent(
+            all_dataframes,
+            config={
+                "llm": llm,
+                "verbose": True,
+                "save_charts": True,
+                "save_charts_path": st.session_state.chart_dir,
+                "open_charts": False,
+            },
+        )
 
         # Cache the agent
         st.session_state.agent = agent
@@ -581,7 +549,7 @@ if "dataframes" in st.session_state:
             st.session_state.messages.append({"role": "user", "content": pending_q})
 
             # Process agent response
-            message_data = process_agent_response(agent, pending_q)
+            message_data = process_agent_response(get_or_create_agent, pending_q)
             st.session_state.messages.append(message_data)
 
         st.rerun()
@@ -596,7 +564,7 @@ if "dataframes" in st.session_state:
             if agent:
                 question = "What is the return on invested capital (ROIC) in 2024?"
                 st.session_state.messages.append({"role": "user", "content": question})
-                message_data = process_agent_response(agent, question)
+                message_data = process_agent_response(get_or_create_agent, question)
                 st.session_state.messages.append(message_data)
                 st.rerun()
             else:
@@ -610,7 +578,7 @@ if "dataframes" in st.session_state:
             if agent:
                 question = "Did the company issue cash dividends in 2024 and what was the exercise date, compare the percentage to last year?"
                 st.session_state.messages.append({"role": "user", "content": question})
-                message_data = process_agent_response(agent, question)
+                message_data = process_agent_response(get_or_create_agent, question)
                 st.session_state.messages.append(message_data)
                 st.rerun()
             else:
@@ -624,7 +592,7 @@ if "dataframes" in st.session_state:
             if agent:
                 question = "What is the company's debt-to-equity ratio and debt coverage metrics?"
                 st.session_state.messages.append({"role": "user", "content": question})
-                message_data = process_agent_response(agent, question)
+                message_data = process_agent_response(get_or_create_agent, question)
                 st.session_state.messages.append(message_data)
                 st.rerun()
             else:
@@ -727,7 +695,7 @@ if "dataframes" in st.session_state:
             # Generate response if there's text content
             if prompt.strip():
                 with st.chat_message("assistant"):
-                    message_data = process_agent_response(agent, prompt)
+                    message_data = process_agent_response(get_or_create_agent, prompt)
 
                     # Display response
                     st.markdown(message_data["content"])
@@ -766,6 +734,9 @@ if "dataframes" in st.session_state:
                     "⚠️ No data loaded yet. Please click 'Analyze Stock' first to load financial data."
                 )
 
+# Re-measure this session after anything this run added to its state
+track_current_session()
+
 # Footer
 st.markdown("---")
 st.markdown(
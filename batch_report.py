@@ -0,0 +1,321 @@
+"""
+Batch report mode: run a question set across many symbols in parallel.
+
+Usage:
+    python batch_report.py --symbols REE VNM FPT
+    python batch_report.py --symbols-file banks.txt --questions-file questions.txt
+
+Symbols are processed in a pool of worker processes, and every symbol's
+questions are asked in order against its own PandasAI agent. Each process has
+its own pyplot state, so generated charts cannot be saved under the wrong
+symbol. LLM calls are bounded by a concurrency limit shared by all workers and
+pause together when OpenAI reports a rate limit. Answers, generated code and
+charts are written to a single report directory (report.md + report.json,
+charts under <symbol>/charts/).
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import warnings
+import multiprocessing
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from vnstock import register_user
+
+# pandasai v2.4.2 imports
+from pandasai import Agent
+
+from core import (
+    SAMPLE_QUESTIONS,
+    detect_latest_chart,
+    get_generated_code,
+    load_financial_data,
+)
+from model_router import create_llm
+from upstream import is_rate_limited, requests_per_minute_limit
+
+warnings.filterwarnings("ignore")
+
+class LLMGate:
+    """
+    Bounds concurrent LLM calls and shares rate-limit backoff across worker
+    processes. When one call is rate limited, every worker waits out the same
+    cooldown instead of hammering the API in parallel.
+    """
+
+    def __init__(self, concurrency, max_retries=5, base_delay=2.0, max_delay=60.0):
+        # Process-shared, so the gate can be handed to pool workers at start-up
+        self._semaphore = multiprocessing.BoundedSemaphore(concurrency)
+        self._paused_until = multiprocessing.Value("d", 0.0)
+        self._rate_limit_hits = multiprocessing.Value("i", 0)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    @property
+    def rate_limit_hits(self):
+        return self._rate_limit_hits.value
+
+    def _wait_for_cooldown(self):
+        while True:
+            # Wall-clock time, comparable across processes
+            with self._paused_until.get_lock():
+                remaining = self._paused_until.value - time.time()
+            if remaining <= 0:
+                return
+            time.sleep(remaining)
+
+    def _pause(self, attempt):
+        delay = min(self.max_delay, self.base_delay * (2**attempt))
+        delay = delay / 2 + random.uniform(0, delay / 2)
+        with self._rate_limit_hits.get_lock():
+            self._rate_limit_hits.value += 1
+        with self._paused_until.get_lock():
+            self._paused_until.value = max(
+                self._paused_until.value, time.time() + delay
+            )
+
+    def chat(self, agent, question):
+        """Ask the agent a question, retrying while the LLM is rate limited"""
+        for attempt in range(self.max_retries + 1):
+            self._wait_for_cooldown()
+            with self._semaphore:
+                try:
+                    response = agent.chat(question)
+                except Exception as e:
+                    if not is_rate_limited(e) or attempt == self.max_retries:
+                        raise
+                    self._pause(attempt)
+                    continue
+            if not is_rate_limited(response) or attempt == self.max_retries:
+                return response
+            self._pause(attempt)
+        return response
+
+
+def run_symbol(symbol, questions, args, llm, gate, output_dir):
+    """Load data for one symbol and answer every question against it"""
+    result = {"symbol": symbol, "error": None, "answers": []}
+    try:
+        _, ai_dataframes = load_financial_data(
+            symbol, args.period, args.source, args.company_source
+        )
+    except Exception as e:
+        result["error"] = f"Error loading data: {str(e)}"
+        return result
+
+    chart_dir = os.path.join(output_dir, symbol, "charts")
+    os.makedirs(chart_dir, exist_ok=True)
+    agent = Agent(
+        list(ai_dataframes.values()),
+        config={
+            "llm": llm,
+            "verbose": False,
+            "save_charts": True,
+            "save_charts_path": chart_dir,
+            "open_charts": False,
+            # PandasAI's response cache is a DuckDB file that only one process
+            # can lock, and batch questions are asked once per symbol anyway
+            "enable_cache": False,
+        },
+    )
+
+    for question in questions:
+        answer = {"question": question}
+        started = time.time()
+        try:
+            response = gate.chat(agent, question)
+            answer["content"] = str(response)
+            answer["generated_code"] = get_generated_code(response, agent)
+            chart_data = detect_latest_chart(chart_dir, since=started)
+            if chart_data:
+                answer["chart"] = os.path.relpath(chart_data["path"], output_dir)
+        except Exception as e:
+            answer["content"] = f"❌ Analysis error: {str(e)}"
+        answer["seconds"] = round(time.time() - started, 2)
+        result["answers"].append(answer)
+
+    return result
+
+
+# Per-process state of a pool worker, set up once by _init_worker
+_worker = {}
+
+
+def _init_worker(api_key, model, gate, requests_per_minute):
+    # Workers split the vnstock limit, as each process paces its own calls
+    os.environ["VNSTOCK_REQUESTS_PER_MINUTE"] = str(requests_per_minute)
+    _worker["llm"] = create_llm(api_key, model)
+    _worker["gate"] = gate
+
+
+def _run_symbol_in_worker(symbol, questions, args, output_dir):
+    return run_symbol(
+        symbol, questions, args, _worker["llm"], _worker["gate"], output_dir
+    )
+
+
+def write_report(results, questions, args, output_dir):
+    """Write the consolidated report as JSON and Markdown"""
+    with open(os.path.join(output_dir, "report.json"), "w", encoding="utf-8") as f:
+        json.dump(
+            {
+                "generated_at": datetime.now().isoformat(timespec="seconds"),
+                "period": args.period,
+                "source": args.source,
+                "model": args.model,
+                "questions": questions,
+                "results": results,
+            },
+            f,
+            ensure_ascii=False,
+            indent=2,
+        )
+
+    lines = [
+        "# Finbro-GPT Batch Report",
+        "",
+        f"- Generated: {datetime.now():%Y-%m-%d %H:%M}",
+        f"- Period: {args.period} | Source: {args.source} | Model: {args.model}",
+        f"- Symbols: {', '.join(r['symbol'] for r in results)}",
+        "",
+    ]
+    for result in results:
+        lines += [f"## {result['symbol']}", ""]
+        if result["error"]:
+            lines += [f"❌ {result['error']}", ""]
+            continue
+        for answer in result["answers"]:
+            lines += [f"### {answer['question']}", "", answer["content"], ""]
+            if "chart" in answer:
+                lines += [f"![chart]({answer['chart']})", ""]
+            if answer.get("generated_code"):
+                lines += ["```python", answer["generated_code"], "```", ""]
+
+    with open(os.path.join(output_dir, "report.md"), "w", encoding="utf-8") as f:
+        f.write("\n".join(lines))
+
+
+def read_lines(path):
+    """Read non-empty, non-comment lines from a text file"""
+    with open(path, encoding="utf-8") as f:
+        lines = [line.strip() for line in f]
+    return [line for line in lines if line and not line.startswith("#")]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Run a question set across many symbols and write a report"
+    )
+    parser.add_argument("--symbols", nargs="*", default=[], help="Stock symbols")
+    parser.add_argument("--symbols-file", help="File with one symbol per line")
+    parser.add_argument(
+        "--questions-file",
+        help="File with one question per line (default: sample questions)",
+    )
+    parser.add_argument("--period", choices=["year", "quarter"], default="year")
+    parser.add_argument("--source", default="VCI", help="Data source (default: VCI)")
+    parser.add_argument(
+        "--company-source",
+        default="KBS",
+        help="Company data source for dividends (default: KBS)",
+    )
+    parser.add_argument(
+        "--model",
+        default=os.environ.get("OPENAI_MODEL", "gpt-4o-mini"),
+        help="OpenAI model (default: $OPENAI_MODEL or gpt-4o-mini)",
+    )
+    parser.add_argument(
+        "--workers", type=int, default=4, help="Symbols processed in parallel"
+    )
+    parser.add_argument(
+        "--llm-concurrency",
+        type=int,
+        default=2,
+        help="Maximum concurrent LLM calls across all symbols",
+    )
+    parser.add_argument(
+        "--output",
+        default=os.path.join(
+            "exports", "reports", datetime.now().strftime("%Y%m%d-%H%M%S")
+        ),
+        help="Report directory (default: exports/reports/<timestamp>)",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    symbols = [s.upper() for s in args.symbols]
+    if args.symbols_file:
+        symbols += [s.upper() for s in read_lines(args.symbols_file)]
+    symbols = list(dict.fromkeys(symbols))
+    if not symbols:
+        print("❌ No symbols given. Use --symbols or --symbols-file.")
+        return 1
+
+    questions = (
+        read_lines(args.questions_file) if args.questions_file else SAMPLE_QUESTIONS
+    )
+
+    api_key = os.environ.get("OPENAI_API_KEY", "")
+    if not api_key:
+        print("❌ OPENAI_API_KEY is not set.")
+        return 1
+
+    vnstock_api_key = os.environ.get("VNSTOCK_API_KEY", "")
+    if vnstock_api_key:
+        try:
+            register_user(vnstock_api_key)
+        except Exception:
+            # vnstock will work in free tier
+            pass
+
+    if args.workers < 1 or args.llm_concurrency < 1:
+        print("❌ --workers and --llm-concurrency must be at least 1.")
+        return 1
+
+    os.makedirs(args.output, exist_ok=True)
+    gate = LLMGate(args.llm_concurrency)
+    requests_per_minute = max(1, requests_per_minute_limit() // args.workers)
+
+    print(
+        f"Running {len(questions)} questions across {len(symbols)} symbols "
+        f"-> {args.output}"
+    )
+    results = {}
+    with ProcessPoolExecutor(
+        max_workers=args.workers,
+        initializer=_init_worker,
+        initargs=(api_key, args.model, gate, requests_per_minute),
+    ) as executor:
+        futures = {
+            executor.submit(
+                _run_symbol_in_worker, symbol, questions, args, args.output
+            ): symbol
+            for symbol in symbols
+        }
+        for future in as_completed(futures):
+            symbol = futures[future]
+            try:
+                results[symbol] = future.result()
+            except Exception as e:
+                results[symbol] = {"symbol": symbol, "error": str(e), "answers": []}
+            status = "❌" if results[symbol]["error"] else "✅"
+            print(f"{status} {symbol} ({len(results)}/{len(symbols)})")
+
+    write_report([results[s] for s in symbols], questions, args, args.output)
+    if gate.rate_limit_hits:
+        print(f"LLM rate limit hit {gate.rate_limit_hits} times")
+    print(f"Report written to {os.path.join(args.output, 'report.md')}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,10 @@
+import os
+
+# Directory for locally stored data (price history, fundamentals, sessions)
+DATA_DIR_ENV = "FINBRO_DATA_DIR"
+DEFAULT_DATA_DIR = "data"
+
+
+def get_data_dir():
+    """Root directory for local data, from $FINBRO_DATA_DIR (default: data)"""
+    return os.environ.get(DATA_DIR_ENV, DEFAULT_DATA_DIR)
@@ -0,0 +1,355 @@
+import os
+import glob
+from datetime import date, timedelta
+import pandas as pd
+from vnstock import Vnstock
+from vnstock.core.utils.transform import flatten_hierarchical_index
+
+from config import get_data_dir
+from upstream import get_upstream_client
+from timeseries_store import get_timeseries_store
+
+# Sample questions for AI analysis (inlined from src.core.config)
+SAMPLE_QUESTIONS = [
+    "Calculate EPS growth in 2024 and compare to the Net Profit Margin percentage in 2024? Convert the Net Profit Margin from decimal to percentage. Answer by concluding whether EPS growth is tracking ahead or behind profitability",
+    "Analyze the dividend yield trend",
+    "What is the company's debt-to-equity ratio?",
+    "What's 2024 revenue growth?",
+    "What's the ROE in 2024?",
+    "Plot a line chart of OCF and Sales over the years?",
+    "What is the company's profitability trend?",
+    "Analyze the balance sheet health indicators",
+]
+
+DEFAULT_CHART_DIR = "exports/charts/"
+
+# First date of the daily price history kept in the local store
+PRICE_HISTORY_START = "2015-01-01"
+
+# Par value of Vietnamese shares; cash dividends are quoted as a fraction of par
+PAR_VALUE_VND = 10000
+
+
+# Helper function to detect latest chart (inlined from src.services.chart_service)
+def detect_latest_chart(chart_dir=DEFAULT_CHART_DIR, since=None):
+    """Detect the most recently generated chart file
+
+    If ``since`` is given, charts created before that timestamp are ignored so a
+    stale chart from an earlier question is not attached to a new answer.
+    """
+    try:
+        if os.path.exists(chart_dir):
+            chart_files = glob.glob(os.path.join(chart_dir, "*.png"))
+            if chart_files:
+                latest_chart = max(chart_files, key=os.path.getctime)
+                if since is None or os.path.getctime(latest_chart) >= since:
+                    return {"type": "image", "path": latest_chart}
+    except Exception:
+        pass
+    return None
+
+
+# Helper function to extract generated code from PandasAI response/agent
+def get_generated_code(response, agent):
+    """Extract generated code from PandasAI response or agent object"""
+    try:
+        # Try response object first
+        if hasattr(response, "last_code_executed") and response.last_code_executed:
+            return response.last_code_executed
+
+        # Try agent object
+        if hasattr(agent, "last_code_executed") and agent.last_code_executed:
+            return agent.last_code_executed
+
+        # Try agent's memory or context
+        if hasattr(agent, "memory") and hasattr(agent.memory, "get_last_code"):
+            code = agent.memory.get_last_code()
+            if code:
+                return code
+
+        # Try to find code in agent's internal state
+        for attr_name in ["_last_code_generated", "_code_executed", "last_code"]:
+            if hasattr(agent, attr_name):
+                code = getattr(agent, attr_name)
+                if code and isinstance(code, str) and len(code.strip()) > 5:
+                    return code
+
+        return "# Code generation details not available"
+
+    except Exception as e:
+        return f"# Error accessing code: {str(e)}"
+
+
+def prepare_ai_dataframe(df, period):
+    """Create a copy of a financial dataframe tuned for PandasAI queries"""
+    df_ai = df.copy()
+
+    # Sort by yearReport in ascending order for proper temporal alignment
+    if not df_ai.empty and "yearReport" in df_ai.columns:
+        df_ai = df_ai.sort_values("yearReport", ascending=True)
+
+    # Rename columns for better query compatibility on quarterly data
+    if (
+        period == "quarter"
+        and "lengthReport" in df_ai.columns
+        and df_ai["lengthReport"].isin([1, 2, 3, 4]).any()
+    ):
+        df_ai = df_ai.rename(columns={"lengthReport": "Quarter"})
+
+    return df_ai
+
+
+def sync_series(dataset, symbol, key, fetch_new):
+    """
+    Refresh a stored time series with rows newer than its last key and return
+    the full series. ``fetch_new(last_key)`` downloads the missing rows; each
+    series is checked upstream at most once per day.
+    """
+    store = get_timeseries_store()
+    with store.lock(dataset, symbol):
+        if not store.synced_today(dataset, symbol):
+            last = store.last_key(dataset, symbol, key)
+            try:
+                store.append(dataset, symbol, fetch_new(last), key)
+                store.mark_synced(dataset, symbol)
+            except Exception:
+                # Serve what is already stored if the incremental update fails
+                if last is None:
+                    raise
+        return store.read(dataset, symbol)
+
+
+# Event columns of each company source, mapped onto the stored dividend schema
+DIVIDEND_EVENT_COLUMNS = {
+    "exercise_date": ("exright_date", "ex_right_date", "ex_date", "exercise_date"),
+    "record_date": ("record_date", "registration_date"),
+    "payment_date": ("issue_date", "payment_date", "pay_date"),
+    "cash_dividend_per_share": ("value", "cash_value", "dividend_value"),
+    "cash_dividend_percentage": ("ratio", "rate", "dividend_rate"),
+    "title": ("event_title_en", "event_title", "title", "event_name", "content"),
+}
+# VCI event code of cash dividends; KBS filters by event type upstream
+VCI_DIVIDEND_CODE = "DIV"
+KBS_DIVIDEND_EVENT_TYPE = 2
+KBS_EVENTS_PAGE_SIZE = 100
+
+
+def fetch_dividend_events(company, company_source):
+    """Dividend events of a company from its source's events endpoint"""
+    if company_source.upper() == "KBS":
+        return company.events(
+            event_type=KBS_DIVIDEND_EVENT_TYPE, page_size=KBS_EVENTS_PAGE_SIZE
+        )
+    events = company.events()
+    for column in ("event_list_code", "event_code"):
+        if column in events.columns:
+            return events[events[column] == VCI_DIVIDEND_CODE]
+    return events
+
+
+def normalize_dividends(events):
+    """
+    Map raw dividend events onto exercise_date, record_date, payment_date,
+    cash_dividend_per_share (VND), cash_dividend_percentage (of par) and title.
+    Raises ValueError if the events have no recognizable exercise date.
+    """
+    if events.empty:
+        return pd.DataFrame()
+
+    dividends = pd.DataFrame(index=events.index)
+    for target, candidates in DIVIDEND_EVENT_COLUMNS.items():
+        column = next((c for c in candidates if c in events.columns), None)
+        if column is not None:
+            dividends[target] = events[column]
+    if "exercise_date" not in dividends.columns:
+        raise ValueError(
+            f"No exercise date in dividend events: {', '.join(events.columns)}"
+        )
+
+    for column in ("exercise_date", "record_date", "payment_date"):
+        if column in dividends.columns:
+            dividends[column] = pd.to_datetime(dividends[column], errors="coerce")
+    for column in ("cash_dividend_per_share", "cash_dividend_percentage"):
+        if column in dividends.columns:
+            dividends[column] = pd.to_numeric(dividends[column], errors="coerce")
+
+    if "cash_dividend_percentage" in dividends.columns:
+        # Sources quote the rate either as a fraction or in percent of par
+        rate = dividends["cash_dividend_percentage"]
+        dividends["cash_dividend_percentage"] = rate.where(rate <= 1, rate / 100)
+        per_share = dividends["cash_dividend_percentage"] * PAR_VALUE_VND
+        if "cash_dividend_per_share" in dividends.columns:
+            per_share = dividends["cash_dividend_per_share"].fillna(per_share)
+        dividends["cash_dividend_per_share"] = per_share
+
+    return dividends.sort_values("exercise_date").reset_index(drop=True)
+
+
+def add_dividend_yield(dividends, prices):
+    """Attach the closing price on each exercise date and the implied cash yield"""
+    if (
+        dividends.empty
+        or prices.empty
+        or "exercise_date" not in dividends.columns
+        or "close" not in prices.columns
+    ):
+        return dividends
+
+    # Events without an exercise date cannot be matched to a price
+    dividends = dividends[dividends["exercise_date"].notna()]
+    merged = pd.merge_asof(
+        dividends.sort_values("exercise_date"),
+        prices[["time", "close"]].sort_values("time"),
+        left_on="exercise_date",
+        right_on="time",
+        direction="backward",
+    )
+    merged = merged.drop(columns="time").rename(columns={"close": "close_price"})
+
+    if "cash_dividend_per_share" in merged.columns:
+        # vnstock quotes prices in thousand VND
+        merged["dividend_yield"] = merged["cash_dividend_per_share"] / (
+            merged["close_price"] * 1000
+        )
+
+    return merged
+
+
+def fetch_upstream(name, stock_symbol, source, fn, **kwargs):
+    """Call vnstock through the shared upstream client"""
+    # Identical requests from concurrent sessions share one upstream call
+    key = (name, stock_symbol, source, tuple(sorted(kwargs.items())))
+    return get_upstream_client().call(key, fn, **kwargs)
+
+
+def fundamentals_dir(period):
+    """Directory holding the cached ratio table of every loaded symbol"""
+    return os.path.join(get_data_dir(), "fundamentals", period)
+
+
+def cache_fundamentals(stock_symbol, period, ratio):
+    """Keep the latest ratio table of a symbol for universe-wide screening"""
+    if ratio.empty:
+        return
+    directory = fundamentals_dir(period)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{stock_symbol.upper()}.arrow")
+    tmp_path = path + ".tmp"
+    ratio.reset_index(drop=True).to_feather(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def load_ratios(stock, stock_symbol, period, source="VCI"):
+    """Load the flattened ratio table for a symbol and cache it for screening"""
+    # Load and process Ratio data (multi-index columns)
+    Ratio_raw = fetch_upstream(
+        "ratio",
+        stock_symbol,
+        source,
+        stock.finance.ratio,
+        period=period,
+        lang="en",
+        dropna=True,
+    )
+
+    # Use vnstock's built-in flatten_hierarchical_index function
+    Ratio = flatten_hierarchical_index(
+        Ratio_raw, separator="_", handle_duplicates=True, drop_levels=0
+    )
+
+    try:
+        cache_fundamentals(stock_symbol, period, Ratio)
+    except Exception:
+        # Screening works from whatever is cached; loading must not fail on it
+        pass
+
+    return Ratio
+
+
+def load_financial_data(stock_symbol, period, source="VCI", company_source="KBS"):
+    """
+    Load financial statements, dividends and daily prices for a symbol.
+    Returns (display_dataframes, ai_dataframes): the originals for display
+    and AI-optimized copies for PandasAI.
+    """
+    stock = Vnstock().stock(symbol=stock_symbol, source=source)
+    company = Vnstock().stock(symbol=stock_symbol, source=company_source).company
+
+    def fetch(name, fn, **kwargs):
+        return fetch_upstream(name, stock_symbol, source, fn, **kwargs)
+
+    # Load financial data
+    CashFlow = fetch("cash_flow", stock.finance.cash_flow, period=period)
+    BalanceSheet = fetch(
+        "balance_sheet",
+        stock.finance.balance_sheet,
+        period=period,
+        lang="en",
+        dropna=True,
+    )
+    IncomeStatement = fetch(
+        "income_statement",
+        stock.finance.income_statement,
+        period=period,
+        lang="en",
+        dropna=True,
+    )
+
+    Ratio = load_ratios(stock, stock_symbol, period, source)
+
+    # Dividends and prices come from the local store, topped up incrementally
+    def fetch_prices(last):
+        if last is None:
+            start = PRICE_HISTORY_START
+        else:
+            start = (last + pd.Timedelta(days=1)).strftime("%Y-%m-%d")
+        # Stop at the last completed session: today's bar is still intraday and
+        # the append-only store would never correct its close
+        end = (date.today() - timedelta(days=1)).isoformat()
+        if start > end:
+            return pd.DataFrame()
+        return fetch(
+            "price_history", stock.quote.history, start=start, end=end, interval="1D"
+        )
+
+    try:
+        price_history = sync_series("price_history", stock_symbol, "time", fetch_prices)
+    except Exception:
+        price_history = pd.DataFrame()
+
+    try:
+        dividend_schedule = sync_series(
+            "dividends",
+            stock_symbol,
+            "exercise_date",
+            lambda last: normalize_dividends(
+                fetch(
+                    f"dividend_events:{company_source}",
+                    lambda: fetch_dividend_events(company, company_source),
+                )
+            ),
+        )
+    except Exception:
+        dividend_schedule = pd.DataFrame()
+
+    # Store original dataframes for display (keep original column names)
+    display_dataframes = {
+        "CashFlow": CashFlow,
+        "BalanceSheet": BalanceSheet,
+        "IncomeStatement": IncomeStatement,
+        "Ratios": Ratio,
+        "Dividends": dividend_schedule,
+        "PriceHistory": price_history,
+    }
+
+    # Create copies with renamed columns for PandasAI (better query compatibility)
+    ai_dataframes = {
+        "CashFlow": prepare_ai_dataframe(CashFlow, period),
+        "BalanceSheet": prepare_ai_dataframe(BalanceSheet, period),
+        "IncomeStatement": prepare_ai_dataframe(IncomeStatement, period),
+        "Ratios": prepare_ai_dataframe(Ratio, period),
+        "Dividends": add_dividend_yield(dividend_schedule, price_history),
+        "PriceHistory": price_history,
+    }
+
+    return display_dataframes, ai_dataframes
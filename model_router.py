@@ -0,0 +1,213 @@
+"""
+Latency-aware model routing for analysis questions.
+
+Questions are classified as a simple ``lookup``, a multi-step ``analysis`` or a
+``chart`` request. Lookups go to whichever configured model has answered them
+fastest so far: each model first serves ``LATENCY_SAMPLES`` lookups (the fast
+model first), then the one with the lowest average latency per successful
+answer is used. The others start on the default model, and a question only
+escalates to the strong model when the answer fails (exception or PandasAI
+error message) or is rejected by validation (e.g. a chart question that
+produced no chart). Latency and success rates are recorded per route and model.
+
+A session keeps one agent and switches its LLM per call, so every model sees
+the same conversation; a rejected attempt is removed from the conversation
+before the question is retried on the next model.
+
+Models come from the environment and must be names PandasAI's OpenAI wrapper
+accepts (e.g. gpt-4o-mini, gpt-4o, gpt-4, gpt-3.5-turbo):
+    OPENAI_FAST_MODEL    first model for lookups (default: OPENAI_MODEL)
+    OPENAI_MODEL         default model (default: gpt-4o-mini)
+    OPENAI_STRONG_MODEL  escalation model (default: OPENAI_MODEL)
+    OPENAI_BASE_URL      OpenAI-compatible endpoint (default: api.openai.com)
+"""
+
+import os
+import re
+import time
+import threading
+
+from pandasai.llm import OpenAI
+
+from core import detect_latest_chart
+
+ROUTES = ("lookup", "analysis", "chart")
+
+CHART_PATTERN = re.compile(
+    r"\b(plot|chart|graph|visuali[sz]e|draw|histogram|scatter)\b", re.IGNORECASE
+)
+ANALYSIS_PATTERN = re.compile(
+    r"\b(analy[sz]e|analysis|compare|comparison|trend|trends|growth|correlat\w*|"
+    r"explain|why|assess|evaluate|forecast|conclud\w*|health|over the years|"
+    r"versus|vs)\b",
+    re.IGNORECASE,
+)
+
+# Lookups each configured model answers before lookups are routed by latency
+LATENCY_SAMPLES = 3
+
+# Prefix of the message PandasAI returns instead of raising when code fails
+PANDASAI_ERROR_PREFIX = "Unfortunately, I was not able to"
+
+
+def create_llm(api_token, model):
+    """PandasAI OpenAI LLM for a model, sent to $OPENAI_BASE_URL if set"""
+    # PandasAI ignores the openai SDK's OPENAI_BASE_URL, so pass it explicitly
+    return OpenAI(
+        api_token=api_token, model=model, api_base=os.environ.get("OPENAI_BASE_URL")
+    )
+
+
+def _conversation(agent):
+    """The agent's conversation history as a mutable list, if it keeps one"""
+    memory = getattr(getattr(agent, "context", None), "memory", None)
+    return memory.all() if memory is not None else None
+
+
+def classify_question(question):
+    """Classify a question as a lookup, multi-step analysis or chart request"""
+    if CHART_PATTERN.search(question):
+        return "chart"
+    if ANALYSIS_PATTERN.search(question) or len(question.split()) > 25:
+        return "analysis"
+    return "lookup"
+
+
+def validate_response(route, response, chart_data):
+    """Return a rejection reason, or None if the response is acceptable"""
+    text = str(response).strip() if response is not None else ""
+    if not text:
+        return "empty response"
+    if text.startswith(PANDASAI_ERROR_PREFIX):
+        return "execution failed"
+    if route == "chart" and not chart_data:
+        return "no chart generated"
+    return None
+
+
+class ModelRouter:
+    """Routes questions to models and records per-route latency and success"""
+
+    def __init__(self, fast_model, default_model, strong_model):
+        self.fast_model = fast_model
+        self.default_model = default_model
+        self.strong_model = strong_model
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def lookup_model(self):
+        """Configured model with the lowest recorded lookup latency"""
+        models = list(
+            dict.fromkeys([self.fast_model, self.default_model, self.strong_model])
+        )
+        with self._lock:
+            stats = {model: self._stats.get(("lookup", model)) for model in models}
+
+        def seconds_per_answer(model):
+            # Quick failures must not make a model look fast
+            if not stats[model]["successes"]:
+                return float("inf")
+            return stats[model]["seconds"] / stats[model]["successes"]
+
+        for model in models:
+            if stats[model] is None or stats[model]["calls"] < LATENCY_SAMPLES:
+                return model
+        return min(models, key=seconds_per_answer)
+
+    def ladder(self, route):
+        """Models to try for a route, in escalation order"""
+        first = self.lookup_model() if route == "lookup" else self.default_model
+        return list(dict.fromkeys([first, self.strong_model]))
+
+    def _record(self, route, model, seconds, success):
+        with self._lock:
+            stats = self._stats.setdefault(
+                (route, model), {"calls": 0, "successes": 0, "seconds": 0.0}
+            )
+            stats["calls"] += 1
+            stats["successes"] += int(success)
+            stats["seconds"] += seconds
+
+    def run(self, question, get_agent, chart_dir=None):
+        """
+        Answer a question, escalating along the route's model ladder.
+        ``get_agent(model)`` returns the PandasAI agent to use for a model
+        (typically the session's agent with its LLM switched to ``model``).
+        Returns a dict with route, model, response, agent, chart_data and
+        rejection (None if the final answer passed validation).
+        """
+        route = classify_question(question)
+        chart_kwargs = {"chart_dir": chart_dir} if chart_dir else {}
+        result = None
+        last_error = None
+        attempt = None
+
+        for model in self.ladder(route):
+            # Drop the previous model's failed exchange before asking again
+            if attempt is not None:
+                history, length = attempt
+                del history[length:]
+                attempt = None
+
+            agent = get_agent(model)
+            history = _conversation(agent)
+            if history is not None:
+                attempt = (history, len(history))
+            started = time.time()
+            try:
+                response = agent.chat(question)
+            except Exception as e:
+                self._record(route, model, time.time() - started, False)
+                last_error = e
+                continue
+
+            chart_data = detect_latest_chart(since=started, **chart_kwargs)
+            rejection = validate_response(route, response, chart_data)
+            self._record(route, model, time.time() - started, rejection is None)
+            result = {
+                "route": route,
+                "model": model,
+                "response": response,
+                "agent": agent,
+                "chart_data": chart_data,
+                "rejection": rejection,
+            }
+            if rejection is None:
+                return result
+
+        if result is None:
+            raise last_error
+        return result
+
+    def stats(self):
+        """Per route and model call counts, success rate and average latency"""
+        with self._lock:
+            items = sorted(self._stats.items())
+        return [
+            {
+                "route": route,
+                "model": model,
+                "calls": stats["calls"],
+                "success_rate": round(stats["successes"] / stats["calls"], 2),
+                "avg_seconds": round(stats["seconds"] / stats["calls"], 2),
+            }
+            for (route, model), stats in items
+        ]
+
+
+_router = None
+_router_lock = threading.Lock()
+
+
+def get_model_router():
+    """Return the process-wide router configured from the environment"""
+    global _router
+    with _router_lock:
+        if _router is None:
+            default_model = os.environ.get("OPENAI_MODEL", "gpt-4o-mini")
+            _router = ModelRouter(
+                fast_model=os.environ.get("OPENAI_FAST_MODEL", default_model),
+                default_model=default_model,
+                strong_model=os.environ.get("OPENAI_STRONG_MODEL", default_model),
+            )
+        return _router
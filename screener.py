@@ -0,0 +1,562 @@
+"""
+Universe-wide vectorized screener over cached fundamentals.
+
+Every time a symbol's statements are loaded, its ratio table is cached under
+``$FINBRO_DATA_DIR/fundamentals/<period>/``. The screener stacks all cached
+tables into a dense ``symbol x period x metric`` NumPy array and evaluates
+filter and rank expressions over the whole universe at once.
+
+Metric names are the ratio column names lower-cased with punctuation replaced
+by underscores (``ROE (%)`` -> ``roe``, ``Debt/Equity`` -> ``debt_equity``);
+see ``available_metrics()``. Ratios are decimals, so 18% is ``0.18``. A bare
+metric is each symbol's latest value; these functions look back from it:
+
+    lag(m, k)       value k periods before the latest
+    change(m, k)    latest minus lag(m, k)
+    growth(m, k)    latest / lag(m, k) - 1
+    mean(m, n)      average of the latest n periods
+    rising(m, n)    increased in each of the last n periods
+    falling(m, n)   decreased in each of the last n periods
+
+Expressions combine them with arithmetic, comparisons and ``and``/``or``/``not``:
+
+    python screener.py "roe > 0.18 and falling(debt_equity, 3)" --rank roe
+
+A filter must be a condition (``roe`` alone is rejected); comparisons with a
+missing value are False, so symbols without the data never match.
+
+``industry`` is each symbol's ICB supersector in English (``Banks``,
+``Real Estate``, ``Food & Beverage``...), matched case-insensitively:
+
+    python screener.py 'industry == "Banks" and roe > 0.18' --rank roe
+    python screener.py 'industry in ("Insurance", "Financial Services")'
+
+The classification comes from VCI's listing and is cached for a week.
+
+Run ``python screener.py --warm`` to cache the whole ``Listing().all_symbols()``
+universe (paced by the shared upstream client).
+"""
+
+import os
+import re
+import ast
+import sys
+import glob
+import time
+import argparse
+import threading
+
+import numpy as np
+import pandas as pd
+from vnstock import Vnstock, Listing
+
+from config import get_data_dir
+from core import fundamentals_dir, load_ratios
+from upstream import get_upstream_client
+
+# Columns identifying the report period rather than holding a metric
+PERIOD_COLUMNS = ("ticker", "yearreport", "lengthreport")
+
+# Industry classification: ICB supersectors from VCI, refreshed weekly
+INDUSTRY_SOURCE = "VCI"
+INDUSTRY_ICB_LEVEL = 2
+INDUSTRY_MAX_AGE_SECONDS = 7 * 24 * 60 * 60
+
+
+class ScreenerError(ValueError):
+    """Raised for expressions the screener cannot evaluate"""
+
+
+def metric_name(column):
+    """Normalize a flattened ratio column name into an expression identifier"""
+    name = str(column).split("_")[-1].lower()
+    name = re.sub(r"[^0-9a-z]+", "_", name).strip("_")
+    if name and name[0].isdigit():
+        name = f"m_{name}"
+    return name
+
+
+def period_label(key, period):
+    """Format a period key (year * 10 + quarter) like the app's period ids"""
+    year, quarter = divmod(int(key), 10)
+    return f"{year}-Q{quarter}" if period == "quarter" else str(year)
+
+
+def _find_column(df, name):
+    for column in df.columns:
+        if metric_name(column) == name:
+            return column
+    return None
+
+
+def industries_path():
+    return os.path.join(get_data_dir(), "fundamentals", "industries.arrow")
+
+
+def industry_table(listing):
+    """Reduce a ``symbols_by_industries()`` table to symbol and industry"""
+    if "icb_level" in listing.columns:
+        # vnstock 4: one row per symbol and ICB level
+        listing = listing[listing["icb_level"] == INDUSTRY_ICB_LEVEL]
+        name_column = "icb_name"
+    elif f"en_icb_name{INDUSTRY_ICB_LEVEL}" in listing.columns:
+        # vnstock 3: one column per ICB level
+        name_column = f"en_icb_name{INDUSTRY_ICB_LEVEL}"
+    else:
+        name_column = f"icb_name{INDUSTRY_ICB_LEVEL}"
+    table = listing[["symbol", name_column]].dropna()
+    table.columns = ["symbol", "industry"]
+    return table.drop_duplicates(subset="symbol").reset_index(drop=True)
+
+
+def load_industries():
+    """
+    Industry of every listed symbol, refreshed from vnstock at most once a
+    week. Falls back to the cached table (or an empty one) when offline.
+    """
+    path = industries_path()
+    try:
+        fresh = time.time() - os.path.getmtime(path) < INDUSTRY_MAX_AGE_SECONDS
+    except OSError:
+        fresh = False
+
+    if not fresh:
+        try:
+            listing = get_upstream_client().call(
+                ("symbols_by_industries", INDUSTRY_SOURCE),
+                lambda: Listing(source=INDUSTRY_SOURCE).symbols_by_industries(
+                    lang="en"
+                ),
+            )
+            table = industry_table(listing)
+            if not table.empty:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp_path = path + ".tmp"
+                table.to_feather(tmp_path)
+                os.replace(tmp_path, path)
+        except Exception:
+            # Screening by metrics must not depend on the listing service
+            pass
+
+    try:
+        return pd.read_feather(path)
+    except Exception:
+        return pd.DataFrame(columns=["symbol", "industry"])
+
+
+class Universe:
+    """Dense symbol x period x metric array built from cached ratio tables"""
+
+    def __init__(self, symbols, periods, metrics, values, industries=None):
+        self.symbols = np.asarray(symbols)
+        self.periods = list(periods)
+        self.metrics = list(metrics)
+        self.metric_index = {metric: i for i, metric in enumerate(self.metrics)}
+        self.values = values
+        # Industry name per symbol ("" if unclassified)
+        if industries is None:
+            industries = [""] * len(self.symbols)
+        self.industries = np.asarray(industries, dtype=str)
+
+        # Index of each symbol's latest reported period per metric (-1 if none)
+        valid = ~np.isnan(values)
+        reversed_first = np.argmax(valid[:, ::-1, :], axis=1)
+        self.last_index = np.where(
+            valid.any(axis=1), len(self.periods) - 1 - reversed_first, -1
+        )
+
+    @classmethod
+    def from_cache(cls, period="year"):
+        paths = sorted(glob.glob(os.path.join(fundamentals_dir(period), "*.arrow")))
+        tables = {}
+        for path in paths:
+            symbol = os.path.splitext(os.path.basename(path))[0]
+            try:
+                tables[symbol] = pd.read_feather(path)
+            except Exception:
+                continue
+
+        # Normalize each table to period key x metric
+        frames = {}
+        for symbol, df in tables.items():
+            year_column = _find_column(df, "yearreport")
+            if year_column is None:
+                continue
+            keys = pd.to_numeric(df[year_column], errors="coerce") * 10
+            quarter_column = _find_column(df, "lengthreport")
+            if period == "quarter" and quarter_column is not None:
+                keys = keys + pd.to_numeric(df[quarter_column], errors="coerce")
+            metric_columns = {}
+            for column in df.columns:
+                name = metric_name(column)
+                if name in PERIOD_COLUMNS or name in metric_columns:
+                    continue
+                if pd.api.types.is_numeric_dtype(df[column]):
+                    metric_columns[name] = column
+            frame = df[list(metric_columns.values())].copy()
+            frame.columns = list(metric_columns.keys())
+            frame.index = keys
+            frame = frame[frame.index.notna()]
+            frames[symbol] = frame[~frame.index.duplicated(keep="last")]
+
+        symbols = sorted(frames)
+        period_keys = sorted({key for frame in frames.values() for key in frame.index})
+        if not period_keys:
+            raise ScreenerError(
+                f"No cached {period} fundamentals yet. Load some companies first "
+                "or run `python screener.py --warm`"
+            )
+        metrics = sorted({name for frame in frames.values() for name in frame.columns})
+        period_pos = {key: i for i, key in enumerate(period_keys)}
+        metric_pos = {name: i for i, name in enumerate(metrics)}
+
+        values = np.full((len(symbols), len(period_keys), len(metrics)), np.nan)
+        for s, symbol in enumerate(symbols):
+            frame = frames[symbol]
+            rows = [period_pos[key] for key in frame.index]
+            cols = [metric_pos[name] for name in frame.columns]
+            values[s][np.ix_(rows, cols)] = frame.to_numpy(dtype=float)
+
+        labels = [period_label(key, period) for key in period_keys]
+        industries = load_industries().set_index("symbol")["industry"]
+        industries = industries.reindex(symbols).fillna("").tolist()
+        return cls(symbols, labels, metrics, values, industries)
+
+    def window(self, metric, n):
+        """(symbols, n + 1) values ending at each symbol's latest period"""
+        m = self._metric(metric)
+        last = self.last_index[:, m]
+        offsets = np.arange(-n, 1)
+        idx = last[:, None] + offsets[None, :]
+        out_of_range = (idx < 0) | (last[:, None] < 0)
+        series = self.values[:, :, m]
+        result = np.take_along_axis(series, np.clip(idx, 0, None), axis=1)
+        result[out_of_range] = np.nan
+        return result
+
+    def latest(self, metric):
+        return self.window(metric, 0)[:, 0]
+
+    def _metric(self, metric):
+        if metric not in self.metric_index:
+            raise ScreenerError(f"Unknown metric '{metric}'")
+        return self.metric_index[metric]
+
+
+def _strings(nodes):
+    """Lower-cased values of string literals, or None if any is not one"""
+    if not all(
+        isinstance(node, ast.Constant) and isinstance(node.value, str)
+        for node in nodes
+    ):
+        return None
+    return [node.value.lower() for node in nodes]
+
+
+def _lag(universe, metric, k):
+    return universe.window(metric, k)[:, 0]
+
+
+def _change(universe, metric, k):
+    w = universe.window(metric, k)
+    return w[:, -1] - w[:, 0]
+
+
+def _growth(universe, metric, k):
+    w = universe.window(metric, k)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return w[:, -1] / w[:, 0] - 1
+
+
+def _mean(universe, metric, n):
+    return universe.window(metric, n - 1).mean(axis=1)
+
+
+def _rising(universe, metric, n):
+    with np.errstate(invalid="ignore"):
+        return (np.diff(universe.window(metric, n), axis=1) > 0).all(axis=1)
+
+
+def _falling(universe, metric, n):
+    with np.errstate(invalid="ignore"):
+        return (np.diff(universe.window(metric, n), axis=1) < 0).all(axis=1)
+
+
+FUNCTIONS = {
+    "lag": _lag,
+    "change": _change,
+    "growth": _growth,
+    "mean": _mean,
+    "rising": _rising,
+    "falling": _falling,
+}
+
+_BINARY_OPERATORS = {
+    ast.Add: np.add,
+    ast.Sub: np.subtract,
+    ast.Mult: np.multiply,
+    ast.Div: np.divide,
+}
+
+_LOGICAL_OPERATORS = {
+    ast.And: np.logical_and,
+    ast.Or: np.logical_or,
+    ast.BitAnd: np.logical_and,
+    ast.BitOr: np.logical_or,
+}
+
+_COMPARISONS = {
+    ast.Gt: np.greater,
+    ast.GtE: np.greater_equal,
+    ast.Lt: np.less,
+    ast.LtE: np.less_equal,
+    ast.Eq: np.equal,
+    ast.NotEq: np.not_equal,
+}
+
+
+class _Evaluator:
+    """Evaluates a parsed expression to a per-symbol array"""
+
+    def __init__(self, universe):
+        self.universe = universe
+        self.metrics = []
+
+    def _use(self, metric):
+        self.universe._metric(metric)
+        if metric not in self.metrics:
+            self.metrics.append(metric)
+        return metric
+
+    def condition(self, node):
+        """Evaluate a node that must be True/False per symbol"""
+        result = self.visit(node)
+        # A bare value would count NaN and any non-zero number as True
+        if np.asarray(result).dtype != bool:
+            expression = ast.unparse(node)
+            raise ScreenerError(
+                f"'{expression}' is a value, not a condition; "
+                f"compare it instead, e.g. {expression} > 0"
+            )
+        return result
+
+    def visit(self, node):
+        if isinstance(node, ast.Expression):
+            return self.visit(node.body)
+        if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)):
+            return node.value
+        if isinstance(node, ast.Name) and node.id == "industry":
+            raise ScreenerError(
+                'industry can only be compared with names, e.g. industry == "Banks"'
+            )
+        if isinstance(node, ast.Name):
+            return self.universe.latest(self._use(node.id))
+        if (
+            isinstance(node, ast.Compare)
+            and isinstance(node.left, ast.Name)
+            and node.left.id == "industry"
+        ):
+            return self._industry(node)
+        if isinstance(node, ast.UnaryOp):
+            if isinstance(node.op, ast.USub):
+                return np.negative(self.visit(node.operand))
+            if isinstance(node.op, (ast.Not, ast.Invert)):
+                return np.logical_not(self.condition(node.operand))
+        if isinstance(node, ast.BinOp) and type(node.op) in _BINARY_OPERATORS:
+            with np.errstate(divide="ignore", invalid="ignore"):
+                return _BINARY_OPERATORS[type(node.op)](
+                    self.visit(node.left), self.visit(node.right)
+                )
+        if isinstance(node, ast.BinOp) and type(node.op) in _LOGICAL_OPERATORS:
+            return _LOGICAL_OPERATORS[type(node.op)](
+                self.condition(node.left), self.condition(node.right)
+            )
+        if isinstance(node, ast.BoolOp):
+            combine = _LOGICAL_OPERATORS[type(node.op)]
+            result = self.condition(node.values[0])
+            for value in node.values[1:]:
+                result = combine(result, self.condition(value))
+            return result
+        if isinstance(node, ast.Compare) and all(
+            type(op) in _COMPARISONS for op in node.ops
+        ):
+            result = True
+            left = self.visit(node.left)
+            for op, comparator in zip(node.ops, node.comparators):
+                right = self.visit(comparator)
+                with np.errstate(invalid="ignore"):
+                    result = np.logical_and(result, _COMPARISONS[type(op)](left, right))
+                left = right
+            return result
+        if (
+            isinstance(node, ast.Call)
+            and isinstance(node.func, ast.Name)
+            and node.func.id in FUNCTIONS
+            and len(node.args) == 2
+            and isinstance(node.args[0], ast.Name)
+            and isinstance(node.args[1], ast.Constant)
+            and isinstance(node.args[1].value, int)
+            and node.args[1].value > 0
+        ):
+            metric = self._use(node.args[0].id)
+            return FUNCTIONS[node.func.id](self.universe, metric, node.args[1].value)
+        raise ScreenerError(f"Unsupported expression: {ast.unparse(node)}")
+
+    def _industry(self, node):
+        """industry == / != "name", or industry in / not in ("name", ...)"""
+        names = None
+        if len(node.ops) == 1:
+            op, comparator = node.ops[0], node.comparators[0]
+            if isinstance(op, (ast.Eq, ast.NotEq)):
+                names = _strings([comparator])
+            elif isinstance(op, (ast.In, ast.NotIn)) and isinstance(
+                comparator, (ast.Tuple, ast.List, ast.Set)
+            ):
+                names = _strings(comparator.elts)
+        if names is None:
+            raise ScreenerError(f"Unsupported expression: {ast.unparse(node)}")
+        if not (self.universe.industries != "").any():
+            raise ScreenerError(
+                "No industry classification available yet; it is fetched from "
+                "vnstock the next time the screener runs online"
+            )
+        matches = np.isin(np.char.lower(self.universe.industries), names)
+        return ~matches if isinstance(op, (ast.NotEq, ast.NotIn)) else matches
+
+
+def evaluate(universe, expression, condition=False):
+    """
+    Evaluate an expression to (per-symbol values, metrics referenced). With
+    ``condition`` the expression must be a True/False test such as a comparison.
+    """
+    try:
+        tree = ast.parse(expression, mode="eval")
+    except SyntaxError as e:
+        raise ScreenerError(f"Invalid expression: {e.msg}") from e
+    evaluator = _Evaluator(universe)
+    if condition:
+        result = evaluator.condition(tree.body)
+    else:
+        result = evaluator.visit(tree)
+    return np.broadcast_to(result, universe.symbols.shape), evaluator.metrics
+
+
+def screen(universe, filter_expression, rank_expression=None, top=50, ascending=False):
+    """
+    Filter and rank the universe. Returns a DataFrame with one row per matching
+    symbol, its latest period and the latest value of every metric referenced.
+    """
+    mask, metrics = evaluate(universe, filter_expression, condition=True)
+    # Writable copy of the broadcast view
+    mask = mask.copy()
+
+    rank = None
+    if rank_expression:
+        rank, rank_metrics = evaluate(universe, rank_expression)
+        rank = np.asarray(rank, dtype=float)
+        metrics += [m for m in rank_metrics if m not in metrics]
+        mask &= ~np.isnan(rank)
+
+    matches = np.flatnonzero(mask)
+    if rank is not None:
+        order = np.argsort(rank[matches], kind="stable")
+        matches = matches[order if ascending else order[::-1]]
+    matches = matches[:top]
+
+    # Latest period reported for any of the referenced metrics
+    metric_columns = [universe.metric_index[m] for m in metrics] or slice(None)
+    latest_period = universe.last_index[:, metric_columns].max(axis=1)[matches]
+
+    result = pd.DataFrame({"symbol": universe.symbols[matches]})
+    result["period"] = [
+        universe.periods[i] if i >= 0 else None for i in latest_period
+    ]
+    result["industry"] = universe.industries[matches]
+    if rank is not None:
+        result["rank_value"] = rank[matches]
+    for metric in metrics:
+        result[metric] = universe.latest(metric)[matches]
+    return result
+
+
+_universes = {}
+_universes_lock = threading.Lock()
+
+
+def _cache_signature(period):
+    paths = glob.glob(os.path.join(fundamentals_dir(period), "*.arrow"))
+    return len(paths), max((os.path.getmtime(p) for p in paths), default=0)
+
+
+def get_universe(period="year"):
+    """Return the universe array, rebuilt only when the cache has changed"""
+    signature = _cache_signature(period)
+    with _universes_lock:
+        cached = _universes.get(period)
+        if cached is None or cached[0] != signature:
+            cached = (signature, Universe.from_cache(period))
+            _universes[period] = cached
+        return cached[1]
+
+
+def available_metrics(period="year"):
+    return get_universe(period).metrics
+
+
+def warm_cache(symbols, period="year", source="VCI"):
+    """Load and cache ratio tables for many symbols, returning failures"""
+    failed = []
+    for i, symbol in enumerate(symbols, 1):
+        try:
+            stock = Vnstock().stock(symbol=symbol, source=source)
+            load_ratios(stock, symbol, period, source)
+            print(f"✅ {symbol} ({i}/{len(symbols)})")
+        except Exception as e:
+            failed.append(symbol)
+            print(f"❌ {symbol} ({i}/{len(symbols)}): {str(e)}")
+    return failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Screen cached fundamentals")
+    parser.add_argument("expression", nargs="?", help="Filter expression")
+    parser.add_argument("--rank", help="Rank expression (highest first)")
+    parser.add_argument("--ascending", action="store_true", help="Lowest first")
+    parser.add_argument("--top", type=int, default=50)
+    parser.add_argument("--period", choices=["year", "quarter"], default="year")
+    parser.add_argument("--source", default="VCI")
+    parser.add_argument(
+        "--warm", action="store_true", help="Cache ratios for all listed symbols"
+    )
+    parser.add_argument("--metrics", action="store_true", help="List metrics")
+    args = parser.parse_args(argv)
+
+    if args.warm:
+        listing = get_upstream_client().call(
+            ("all_symbols",), lambda: Listing().all_symbols()
+        )
+        symbols = sorted(listing["symbol"].tolist())
+        failed = warm_cache(symbols, args.period, args.source)
+        print(f"Cached {len(symbols) - len(failed)}/{len(symbols)} symbols")
+
+    try:
+        if args.metrics:
+            print("\n".join(available_metrics(args.period)))
+
+        if args.expression:
+            result = screen(
+                get_universe(args.period),
+                args.expression,
+                args.rank,
+                args.top,
+                args.ascending,
+            )
+            print(result.to_string(index=False))
+    except ScreenerError as e:
+        print(f"❌ {str(e)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,280 @@
+"""
+Per-session memory budget with idle-session eviction to disk.
+
+Streamlit keeps every browser session's ``st.session_state`` in memory for as
+long as the server runs, so idle tabs holding financial statements, uploaded
+files and chat history add up. ``track_current_session()`` is called at the
+start of every script run, and again after the session's data changes, to:
+
+- rehydrate the session's heavy objects if they were spilled to disk,
+- record how much memory the session holds and when it was last active,
+- forget sessions the Streamlit runtime no longer serves (closed tabs),
+- spill the least-recently-active idle sessions to disk while the total
+  resident size is over the global budget.
+
+PandasAI agents and LLM clients cannot be pickled, so they are dropped on
+eviction and rebuilt from the dataframes on the session's next question.
+"""
+
+import os
+import sys
+import glob
+import time
+import pickle
+import threading
+
+import pandas as pd
+from streamlit.runtime import Runtime
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+from config import get_data_dir
+
+# Session state keys holding large objects, spilled to disk on eviction
+HEAVY_KEYS = (
+    "display_dataframes",
+    "dataframes",
+    "uploaded_dataframes",
+    "messages",
+    "symbols_df",
+)
+
+# Session state keys that cannot be pickled and are rebuilt on demand
+DROP_KEYS = ("agent", "agent_key", "llms")
+
+DEFAULT_BUDGET_MB = 1024
+DEFAULT_IDLE_SECONDS = 600
+SPILL_TTL_SECONDS = 24 * 60 * 60
+
+
+def estimate_size(obj, seen=None):
+    """Approximate memory held by an object, counting shared objects once"""
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+
+    if isinstance(obj, pd.DataFrame):
+        return int(obj.memory_usage(deep=True).sum())
+    if isinstance(obj, dict):
+        return sys.getsizeof(obj) + sum(
+            estimate_size(value, seen) for value in obj.values()
+        )
+    if isinstance(obj, (list, tuple)):
+        return sys.getsizeof(obj) + sum(estimate_size(item, seen) for item in obj)
+    return sys.getsizeof(obj)
+
+
+def session_size(state):
+    """
+    Approximate memory held by a session: its heavy keys plus what its PandasAI
+    agent holds. The agent wraps the session's own dataframes, which are only
+    counted once, and adds its conversation history.
+    """
+    objects = [state[key] for key in HEAVY_KEYS if key in state]
+    agent = state["agent"] if "agent" in state else None
+    if agent is not None:
+        objects.extend(
+            getattr(connector, "pandas_df", None)
+            for connector in getattr(agent, "dfs", [])
+        )
+        memory = getattr(getattr(agent, "context", None), "memory", None)
+        if memory is not None:
+            objects.append(memory.all())
+    return estimate_size(objects)
+
+
+def is_active_session(session_id):
+    """Whether the Streamlit runtime still serves a session"""
+    if not Runtime.exists():
+        return True
+    return Runtime.instance().is_active_session(session_id)
+
+
+class _SessionEntry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.state = None
+        self.last_active = 0.0
+        self.resident_bytes = 0
+        self.spill_path = None
+
+
+class SessionMemoryManager:
+    """Tracks session memory and spills idle sessions once over budget"""
+
+    def __init__(
+        self,
+        budget_bytes,
+        spill_dir,
+        idle_seconds=DEFAULT_IDLE_SECONDS,
+        is_active=is_active_session,
+    ):
+        self.budget_bytes = budget_bytes
+        self.spill_dir = spill_dir
+        self.idle_seconds = idle_seconds
+        self.is_active = is_active
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self._evictions = 0
+        self._rehydrations = 0
+
+        # Sessions from a previous server process can never return
+        os.makedirs(spill_dir, exist_ok=True)
+        for path in glob.glob(os.path.join(spill_dir, "*.pkl")):
+            os.remove(path)
+
+    def _entry(self, session_id):
+        with self._lock:
+            if session_id not in self._sessions:
+                self._sessions[session_id] = _SessionEntry()
+            return self._sessions[session_id]
+
+    def track(self, session_id, state):
+        """Mark a session active, rehydrate it if spilled and enforce the budget"""
+        entry = self._entry(session_id)
+        with entry.lock:
+            entry.last_active = time.time()
+            entry.state = state
+            if entry.spill_path:
+                self._rehydrate(entry, state)
+            entry.resident_bytes = session_size(state)
+        self._enforce_budget(session_id)
+
+    def _rehydrate(self, entry, state):
+        try:
+            with open(entry.spill_path, "rb") as f:
+                spilled = pickle.load(f)
+            for key, value in spilled.items():
+                state[key] = value
+            os.remove(entry.spill_path)
+        except Exception:
+            # A lost spill file leaves the session to reload its data
+            pass
+        entry.spill_path = None
+        with self._lock:
+            self._rehydrations += 1
+
+    def _evict(self, session_id, entry):
+        state = entry.state
+        spilled = {key: state[key] for key in HEAVY_KEYS if key in state}
+        path = os.path.join(self.spill_dir, f"{session_id}.pkl")
+        with open(path, "wb") as f:
+            pickle.dump(spilled, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+        for key in HEAVY_KEYS + DROP_KEYS:
+            if key in state:
+                del state[key]
+        entry.spill_path = path
+        entry.state = None
+        entry.resident_bytes = 0
+        with self._lock:
+            self._evictions += 1
+
+    def _enforce_budget(self, current_session_id):
+        now = time.time()
+        with self._lock:
+            sessions = list(self._sessions.items())
+
+        # Forget closed sessions, and spilled sessions gone for a long time, so
+        # their state isn't pinned here or counted as resident
+        active_sessions = []
+        for session_id, entry in sessions:
+            is_current = session_id == current_session_id
+            closed = not is_current and not self.is_active(session_id)
+            idle_for = now - entry.last_active
+            expired = entry.spill_path and idle_for > SPILL_TTL_SECONDS
+            if not (closed or expired):
+                active_sessions.append((session_id, entry))
+                continue
+            with entry.lock:
+                with self._lock:
+                    self._sessions.pop(session_id, None)
+                entry.state = None
+                entry.resident_bytes = 0
+                if entry.spill_path:
+                    try:
+                        os.remove(entry.spill_path)
+                    except OSError:
+                        pass
+                    entry.spill_path = None
+        sessions = active_sessions
+
+        resident = sum(entry.resident_bytes for _, entry in sessions)
+        if resident <= self.budget_bytes:
+            return
+
+        candidates = sorted(
+            (
+                (entry.last_active, session_id, entry)
+                for session_id, entry in sessions
+                if session_id != current_session_id and entry.state is not None
+            ),
+            key=lambda item: item[0],
+        )
+        for _, session_id, entry in candidates:
+            if resident <= self.budget_bytes:
+                break
+            with entry.lock:
+                # Skip sessions that became active while we were deciding
+                if entry.state is None or now - entry.last_active < self.idle_seconds:
+                    continue
+                freed = entry.resident_bytes
+                try:
+                    self._evict(session_id, entry)
+                except Exception:
+                    continue
+            resident -= freed
+
+    def stats(self):
+        """Resident vs spilled session counts and memory use"""
+        with self._lock:
+            entries = list(self._sessions.values())
+            evictions = self._evictions
+            rehydrations = self._rehydrations
+        resident = [entry for entry in entries if entry.state is not None]
+        return {
+            "resident_sessions": len(resident),
+            "spilled_sessions": sum(1 for entry in entries if entry.spill_path),
+            "resident_mb": round(
+                sum(entry.resident_bytes for entry in resident) / 1024**2, 1
+            ),
+            "budget_mb": round(self.budget_bytes / 1024**2, 1),
+            "evictions": evictions,
+            "rehydrations": rehydrations,
+        }
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_session_memory():
+    """
+    Return the process-wide manager. The budget is FINBRO_MEMORY_BUDGET_MB
+    (default 1024) and sessions must be idle for FINBRO_SESSION_IDLE_SECONDS
+    (default 600) before they can be spilled to $FINBRO_DATA_DIR/sessions.
+    """
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            budget_mb = float(
+                os.environ.get("FINBRO_MEMORY_BUDGET_MB", DEFAULT_BUDGET_MB)
+            )
+            idle_seconds = float(
+                os.environ.get("FINBRO_SESSION_IDLE_SECONDS", DEFAULT_IDLE_SECONDS)
+            )
+            _manager = SessionMemoryManager(
+                int(budget_mb * 1024**2),
+                os.path.join(get_data_dir(), "sessions"),
+                idle_seconds,
+            )
+        return _manager
+
+
+def track_current_session():
+    """Register the running session with the memory manager"""
+    ctx = get_script_run_ctx()
+    if ctx is None:
+        return
+    get_session_memory().track(ctx.session_id, ctx.session_state)
@@ -0,0 +1,167 @@
+"""Batch report tests with stub agents and a local OpenAI-compatible server"""
+
+import json
+import multiprocessing
+from argparse import Namespace
+
+import pandas as pd
+import pytest
+
+import batch_report
+from batch_report import LLMGate, main, read_lines, write_report
+
+CHART = (
+    "```python\n"
+    "import matplotlib.pyplot as plt\n"
+    'plt.plot(dfs[0]["close"])\n'
+    'plt.savefig("temp_chart.png")\n'
+    'result = {"type": "plot", "value": "temp_chart.png"}\n'
+    "```"
+)
+
+
+class RateLimitError(Exception):
+    status_code = 429
+
+
+class StubAgent:
+    """Replays a list of replies; exceptions in the list are raised"""
+
+    def __init__(self, replies):
+        self.replies = list(replies)
+        self.calls = 0
+
+    def chat(self, question):
+        self.calls += 1
+        reply = self.replies.pop(0)
+        if isinstance(reply, Exception):
+            raise reply
+        return reply
+
+
+def report_args(**overrides):
+    args = {"period": "year", "source": "VCI", "model": "gpt-4o-mini"}
+    args.update(overrides)
+    return Namespace(**args)
+
+
+def test_read_lines_skips_blanks_and_comments(tmp_path):
+    path = tmp_path / "symbols.txt"
+    path.write_text("# banks\nVCB\n\n  BID  \n#CTG\n", encoding="utf-8")
+
+    assert read_lines(str(path)) == ["VCB", "BID"]
+
+
+def test_write_report(tmp_path):
+    results = [
+        {
+            "symbol": "VCB",
+            "error": None,
+            "answers": [
+                {
+                    "question": "What's the ROE in 2024?",
+                    "content": "0.18",
+                    "generated_code": "result = 0.18",
+                    "chart": "VCB/charts/roe.png",
+                }
+            ],
+        },
+        {"symbol": "XYZ", "error": "Error loading data: not found", "answers": []},
+    ]
+
+    write_report(results, ["What's the ROE in 2024?"], report_args(), str(tmp_path))
+
+    report = json.loads((tmp_path / "report.json").read_text(encoding="utf-8"))
+    assert report["model"] == "gpt-4o-mini"
+    assert [r["symbol"] for r in report["results"]] == ["VCB", "XYZ"]
+    markdown = (tmp_path / "report.md").read_text(encoding="utf-8")
+    assert "## VCB" in markdown
+    assert "![chart](VCB/charts/roe.png)" in markdown
+    assert "```python\nresult = 0.18\n```" in markdown
+    assert "❌ Error loading data: not found" in markdown
+
+
+@pytest.mark.parametrize(
+    "argv, env, message",
+    [
+        ([], {"OPENAI_API_KEY": "sk-test"}, "No symbols given"),
+        (["--symbols", "VCB"], {}, "OPENAI_API_KEY is not set"),
+        (
+            ["--symbols", "VCB", "--llm-concurrency", "0"],
+            {"OPENAI_API_KEY": "sk-test"},
+            "must be at least 1",
+        ),
+    ],
+)
+def test_main_validates_arguments(monkeypatch, capsys, argv, env, message):
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+    for name, value in env.items():
+        monkeypatch.setenv(name, value)
+
+    assert main(argv) == 1
+    assert message in capsys.readouterr().out
+
+
+def test_gate_retries_rate_limited_calls():
+    gate = LLMGate(1, base_delay=0.01, max_delay=0.01)
+    agent = StubAgent(
+        [
+            RateLimitError("Too Many Requests"),
+            "Unfortunately, I was not able to answer: Error code: 429",
+            "42",
+        ]
+    )
+
+    assert gate.chat(agent, "What's the ROE?") == "42"
+    assert agent.calls == 3
+    assert gate.rate_limit_hits == 2
+
+
+def test_gate_gives_up_after_max_retries():
+    gate = LLMGate(1, max_retries=2, base_delay=0.01, max_delay=0.01)
+    agent = StubAgent([RateLimitError("Too Many Requests")] * 3)
+
+    with pytest.raises(RateLimitError):
+        gate.chat(agent, "What's the ROE?")
+    assert agent.calls == 3
+
+
+def test_gate_does_not_retry_other_errors():
+    gate = LLMGate(1, base_delay=0.01)
+    agent = StubAgent([ValueError("bad question")])
+
+    with pytest.raises(ValueError):
+        gate.chat(agent, "What's the ROE?")
+    assert gate.rate_limit_hits == 0
+
+
+@pytest.mark.skipif(
+    multiprocessing.get_start_method() != "fork",
+    reason="workers inherit the patched data loader only when forked",
+)
+def test_main_writes_each_symbols_chart_under_its_own_directory(
+    llm_server, monkeypatch, tmp_path
+):
+    llm_server.replies["gpt-4o-mini"] = CHART
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    monkeypatch.delenv("VNSTOCK_API_KEY", raising=False)
+
+    def load_financial_data(symbol, period, source, company_source):
+        prices = pd.DataFrame({"close": [10.0, 11.0, 12.0]})
+        return {"PriceHistory": prices}, {"PriceHistory": prices}
+
+    monkeypatch.setattr(batch_report, "load_financial_data", load_financial_data)
+    questions = tmp_path / "questions.txt"
+    questions.write_text("Plot the closing price\n", encoding="utf-8")
+    output = tmp_path / "report"
+
+    argv = ["--symbols", "VCB", "BID", "CTG", "--workers", "3"]
+    argv += ["--questions-file", str(questions), "--output", str(output)]
+    assert main(argv) == 0
+
+    report = json.loads((output / "report.json").read_text(encoding="utf-8"))
+    for result in report["results"]:
+        (answer,) = result["answers"]
+        assert answer["chart"].startswith(f"{result['symbol']}/charts/")
+        assert (output / answer["chart"]).exists()
+
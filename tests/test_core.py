@@ -0,0 +1,102 @@
+"""Dividend event mapping and yield tests over a recorded VCI events frame"""
+
+import pandas as pd
+import pytest
+
+from core import add_dividend_yield, fetch_dividend_events, normalize_dividends
+
+# Shape of vnstock's VCI Company.events() for REE (dates already as strings)
+VCI_EVENTS = pd.DataFrame(
+    {
+        "id": [101, 102, 103, 104],
+        "event_title_en": [
+            "REE - Cash dividend 2022",
+            "REE - Stock issuance",
+            "REE - Cash dividend 2023",
+            "REE - Annual general meeting",
+        ],
+        "public_date": ["2023-06-01", "2023-06-20", "2024-06-03", "2024-04-10"],
+        "issue_date": ["2023-07-14", "2023-08-01", "2024-07-12", None],
+        "record_date": ["2023-06-16", "2023-07-10", "2024-06-14", "2024-03-20"],
+        "exright_date": ["2023-06-15", "2023-07-07", "2024-06-13", "2024-03-19"],
+        "event_list_code": ["DIV", "ISS", "DIV", "AGME"],
+        "ratio": [0.1, 0.15, 0.1, None],
+        "value": [1000.0, None, None, None],
+    }
+)
+
+PRICES = pd.DataFrame(
+    {
+        "time": pd.to_datetime(["2023-06-14", "2023-06-15", "2024-06-12"]),
+        "close": [62.0, 64.0, 50.0],
+    }
+)
+
+
+class RecordedCompany:
+    def __init__(self, events):
+        self._events = events
+        self.calls = []
+
+    def events(self, **kwargs):
+        self.calls.append(kwargs)
+        return self._events
+
+
+def test_vci_events_are_filtered_to_cash_dividends():
+    company = RecordedCompany(VCI_EVENTS)
+
+    events = fetch_dividend_events(company, "VCI")
+
+    assert events["id"].tolist() == [101, 103]
+    assert company.calls == [{}]
+
+
+def test_kbs_requests_dividend_events():
+    company = RecordedCompany(pd.DataFrame())
+
+    fetch_dividend_events(company, "KBS")
+
+    assert company.calls[0]["event_type"] == 2
+
+
+def test_normalize_dividends_maps_recorded_events():
+    dividends = normalize_dividends(
+        fetch_dividend_events(RecordedCompany(VCI_EVENTS), "VCI")
+    )
+
+    assert len(dividends) == 2
+    assert dividends["exercise_date"].tolist() == list(
+        pd.to_datetime(["2023-06-15", "2024-06-13"])
+    )
+    assert dividends["record_date"].iloc[0] == pd.Timestamp("2023-06-16")
+    # The second event only has a ratio, so its cash amount is derived from par
+    assert dividends["cash_dividend_per_share"].tolist() == [1000.0, 1000.0]
+    assert dividends["cash_dividend_percentage"].tolist() == [0.1, 0.1]
+
+
+def test_percent_ratios_are_scaled_to_fractions():
+    events = pd.DataFrame({"exright_date": ["2024-06-13"], "ratio": [15]})
+
+    dividends = normalize_dividends(events)
+
+    assert dividends["cash_dividend_percentage"].tolist() == [0.15]
+    assert dividends["cash_dividend_per_share"].tolist() == [1500.0]
+
+
+def test_unrecognized_events_raise():
+    events = pd.DataFrame({"date": ["2024-06-13"], "amount": [1000]})
+
+    with pytest.raises(ValueError, match="No exercise date"):
+        normalize_dividends(events)
+
+
+def test_dividend_yield_uses_close_on_or_before_exercise_date():
+    dividends = normalize_dividends(
+        fetch_dividend_events(RecordedCompany(VCI_EVENTS), "VCI")
+    )
+
+    result = add_dividend_yield(dividends, PRICES)
+
+    assert result["close_price"].tolist() == [64.0, 50.0]
+    assert result["dividend_yield"].tolist() == pytest.approx([1000 / 64000, 0.02])
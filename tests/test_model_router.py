@@ -0,0 +1,251 @@
+"""
+Model routing tests against a local OpenAI-compatible stub server.
+
+The ``llm_server`` fixture (see conftest.py) answers each model with a canned
+reply, and PandasAI agents reach it through ``create_llm``.
+"""
+
+import json
+import os
+
+import pandas as pd
+import pytest
+from pandasai import Agent
+
+from model_router import LATENCY_SAMPLES, ModelRouter, classify_question, create_llm
+
+FAST_MODEL = "gpt-3.5-turbo"
+DEFAULT_MODEL = "gpt-4o-mini"
+STRONG_MODEL = "gpt-4o"
+
+
+def code_reply(code):
+    return f"```python\n{code}\n```"
+
+
+ROW_COUNT = code_reply('result = {"type": "number", "value": len(dfs[0])}')
+# Fails on every error-correction attempt, so PandasAI returns its error message
+BROKEN = code_reply('result = {"type": "number", "value": dfs[0]["missing"].sum()}')
+NO_CHART = code_reply('result = {"type": "string", "value": "Closing prices rose"}')
+CHART = code_reply(
+    "import matplotlib.pyplot as plt\n"
+    'plt.plot(dfs[0]["close"])\n'
+    'plt.savefig("temp_chart.png")\n'
+    'result = {"type": "plot", "value": "temp_chart.png"}'
+)
+
+
+@pytest.fixture
+def router():
+    return ModelRouter(FAST_MODEL, DEFAULT_MODEL, STRONG_MODEL)
+
+
+def make_session(chart_dir="charts"):
+    """One agent per session with its LLM switched per model, as in the app"""
+    llms = {}
+    agent = Agent(
+        [pd.DataFrame({"close": [10.5, 11.0, 10.8]})],
+        config={
+            "llm": create_llm("sk-test", DEFAULT_MODEL),
+            "enable_cache": False,
+            "save_logs": False,
+            "save_charts": True,
+            "save_charts_path": chart_dir,
+            "open_charts": False,
+        },
+    )
+
+    def get_agent(model):
+        if model not in llms:
+            llms[model] = create_llm("sk-test", model)
+        agent.config.llm = llms[model]
+        return agent
+
+    return agent, get_agent
+
+
+class FailingAgent:
+    def chat(self, question):
+        raise ConnectionError("Connection refused")
+
+
+@pytest.mark.parametrize(
+    "question, route",
+    [
+        ("What's the ROE in 2024?", "lookup"),
+        ("What is the company's debt-to-equity ratio?", "lookup"),
+        ("Analyze the dividend yield trend", "analysis"),
+        ("Compare 2024 revenue growth to net margin", "analysis"),
+        ("Plot a line chart of OCF and Sales over the years?", "chart"),
+        ("Draw a histogram of daily returns", "chart"),
+        (" ".join(["What is the value of this item"] * 4) + "?", "analysis"),
+    ],
+)
+def test_classify_question(question, route):
+    assert classify_question(question) == route
+
+
+def record_lookups(router, model, seconds, successes=LATENCY_SAMPLES):
+    for i in range(LATENCY_SAMPLES):
+        router._record("lookup", model, seconds, i < successes)
+
+
+def test_lookup_model_samples_each_model_first(router):
+    assert router.ladder("lookup") == [FAST_MODEL, STRONG_MODEL]
+
+    record_lookups(router, FAST_MODEL, 2.0)
+    assert router.lookup_model() == DEFAULT_MODEL
+    record_lookups(router, DEFAULT_MODEL, 1.0)
+    assert router.lookup_model() == STRONG_MODEL
+    record_lookups(router, STRONG_MODEL, 3.0)
+
+    assert router.ladder("lookup") == [DEFAULT_MODEL, STRONG_MODEL]
+    assert router.ladder("analysis") == [DEFAULT_MODEL, STRONG_MODEL]
+
+
+def test_lookup_model_penalizes_failures(router):
+    # Quick failures and a model that never answers don't count as fast
+    record_lookups(router, FAST_MODEL, 0.1, successes=0)
+    record_lookups(router, DEFAULT_MODEL, 1.0, successes=1)
+    record_lookups(router, STRONG_MODEL, 2.0)
+
+    assert router.lookup_model() == STRONG_MODEL
+
+
+def test_create_llm_sends_requests_to_base_url(llm_server):
+    llm_server.replies[DEFAULT_MODEL] = ROW_COUNT
+    agent, get_agent = make_session()
+
+    assert get_agent(DEFAULT_MODEL).chat("How many rows are there?") == 3
+    assert llm_server.models_called() == [DEFAULT_MODEL]
+
+
+def test_escalates_on_exception(llm_server, router):
+    llm_server.replies[STRONG_MODEL] = ROW_COUNT
+    agent, get_agent = make_session()
+
+    def get_agent_failing_fast(model):
+        return FailingAgent() if model == FAST_MODEL else get_agent(model)
+
+    result = router.run("How many rows are there?", get_agent_failing_fast)
+
+    assert result["route"] == "lookup"
+    assert result["model"] == STRONG_MODEL
+    assert result["response"] == 3
+    assert result["rejection"] is None
+    assert llm_server.models_called() == [STRONG_MODEL]
+
+
+def test_reraises_when_every_model_fails(router):
+    with pytest.raises(ConnectionError):
+        router.run("How many rows are there?", lambda model: FailingAgent())
+
+
+def test_escalates_on_pandasai_error_message(llm_server, router):
+    llm_server.replies[FAST_MODEL] = BROKEN
+    llm_server.replies[STRONG_MODEL] = ROW_COUNT
+    agent, get_agent = make_session()
+
+    result = router.run("How many rows are there?", get_agent)
+
+    assert result["model"] == STRONG_MODEL
+    assert result["response"] == 3
+    assert result["rejection"] is None
+    assert set(llm_server.models_called()) == {FAST_MODEL, STRONG_MODEL}
+    assert llm_server.models_called()[-1] == STRONG_MODEL
+
+
+def test_escalates_when_chart_question_draws_no_chart(llm_server, router):
+    llm_server.replies[DEFAULT_MODEL] = NO_CHART
+    llm_server.replies[STRONG_MODEL] = CHART
+    agent, get_agent = make_session()
+
+    result = router.run("Plot the closing price", get_agent, chart_dir="charts")
+
+    assert result["route"] == "chart"
+    assert result["model"] == STRONG_MODEL
+    assert result["rejection"] is None
+    assert result["chart_data"]["type"] == "image"
+    assert llm_server.models_called() == [DEFAULT_MODEL, STRONG_MODEL]
+
+
+def test_ignores_charts_drawn_by_another_session(llm_server, router):
+    llm_server.replies[DEFAULT_MODEL] = NO_CHART
+    llm_server.replies[STRONG_MODEL] = NO_CHART
+    agent, get_agent = make_session(chart_dir="charts/session-a")
+
+    class OtherSessionDraws:
+        """Saves another tab's chart while this session's question runs"""
+
+        def __init__(self, agent):
+            self.agent = agent
+
+        def chat(self, question):
+            os.makedirs("charts/session-b", exist_ok=True)
+            open("charts/session-b/chart.png", "wb").close()
+            return self.agent.chat(question)
+
+    result = router.run(
+        "Plot the closing price",
+        lambda model: OtherSessionDraws(get_agent(model)),
+        chart_dir="charts/session-a",
+    )
+
+    assert result["chart_data"] is None
+    assert result["rejection"] == "no chart generated"
+
+
+def test_keeps_last_answer_when_strong_model_is_rejected(llm_server, router):
+    llm_server.replies[DEFAULT_MODEL] = NO_CHART
+    llm_server.replies[STRONG_MODEL] = NO_CHART
+    agent, get_agent = make_session()
+
+    result = router.run("Plot the closing price", get_agent, chart_dir="charts")
+
+    assert result["model"] == STRONG_MODEL
+    assert result["response"] == "Closing prices rose"
+    assert result["rejection"] == "no chart generated"
+
+
+def test_models_share_one_conversation(llm_server, router):
+    llm_server.replies[FAST_MODEL] = BROKEN
+    llm_server.replies[STRONG_MODEL] = ROW_COUNT
+    agent, get_agent = make_session()
+
+    router.run("How many rows are there?", get_agent)
+
+    # The fast model's failed attempt is dropped before the strong model answers
+    assert [entry["message"] for entry in agent.context.memory.all()] == [
+        "How many rows are there?",
+        "3",
+    ]
+
+    llm_server.replies[FAST_MODEL] = ROW_COUNT
+    llm_server.requests.clear()
+    result = router.run("And how many columns?", get_agent)
+
+    assert result["model"] == FAST_MODEL
+    prompt = json.dumps(llm_server.requests[0]["messages"])
+    assert "How many rows are there?" in prompt
+    assert len(agent.context.memory.all()) == 4
+
+
+def test_stats_per_route_and_model(llm_server, router):
+    llm_server.replies[FAST_MODEL] = ROW_COUNT
+    llm_server.replies[STRONG_MODEL] = ROW_COUNT
+    agent, get_agent = make_session()
+
+    router.run("How many rows are there?", get_agent)
+    router.run("What is the row count?", get_agent)
+    llm_server.replies[FAST_MODEL] = BROKEN
+    router.run("How many rows now?", get_agent)
+
+    stats = router.stats()
+
+    assert [(row["route"], row["model"], row["calls"]) for row in stats] == [
+        ("lookup", FAST_MODEL, 3),
+        ("lookup", STRONG_MODEL, 1),
+    ]
+    assert stats[0]["success_rate"] == 0.67
+    assert stats[1]["success_rate"] == 1.0
+    assert all(row["avg_seconds"] >= 0 for row in stats)
@@ -0,0 +1,128 @@
+"""Screener tests over a small fundamentals cache in a temporary data dir"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from core import cache_fundamentals
+from screener import (
+    ScreenerError,
+    Universe,
+    get_universe,
+    industries_path,
+    industry_table,
+    main,
+    screen,
+)
+
+
+@pytest.fixture
+def data_dir(monkeypatch, tmp_path):
+    monkeypatch.setenv("FINBRO_DATA_DIR", str(tmp_path))
+    return tmp_path
+
+
+def cache_ratios(symbol, years, roe, debt_equity):
+    ratio = pd.DataFrame(
+        {
+            "Meta_ticker": symbol,
+            "Meta_yearReport": years,
+            "Meta_lengthReport": 5,
+            "Profitability_ROE (%)": roe,
+            "Capital Structure_Debt/Equity": debt_equity,
+        }
+    )
+    cache_fundamentals(symbol, "year", ratio)
+
+
+def cache_industries(industries):
+    table = pd.DataFrame(
+        {"symbol": list(industries), "industry": list(industries.values())}
+    )
+    table.to_feather(industries_path())
+
+
+@pytest.fixture
+def universe(data_dir):
+    years = [2021, 2022, 2023]
+    cache_ratios("ACB", years, [0.20, 0.22, 0.24], [9.0, 8.5, 8.0])
+    cache_ratios("FPT", years, [0.25, 0.26, 0.27], [1.0, 1.1, 1.2])
+    cache_ratios("HPG", years, [0.30, 0.10, np.nan], [0.9, 1.0, 1.1])
+    cache_industries({"ACB": "Banks", "FPT": "Technology"})
+    return Universe.from_cache("year")
+
+
+def test_screen_filters_and_ranks(universe):
+    result = screen(universe, "roe > 0.18 and falling(debt_equity, 2)", "roe")
+
+    assert result["symbol"].tolist() == ["ACB"]
+    assert result["period"].tolist() == ["2023"]
+    assert result["roe"].tolist() == [0.24]
+
+
+def test_empty_cache_raises_screener_error(data_dir):
+    with pytest.raises(ScreenerError, match="No cached year fundamentals"):
+        get_universe("year")
+
+
+def test_cli_reports_empty_cache(data_dir, capsys):
+    assert main(["roe > 0.18"]) == 1
+    assert "No cached year fundamentals" in capsys.readouterr().out
+
+
+@pytest.mark.parametrize(
+    "expression", ["roe", "lag(roe, 5)", "roe and debt_equity < 2", "not roe"]
+)
+def test_filter_must_be_a_condition(universe, expression):
+    with pytest.raises(ScreenerError, match="not a condition"):
+        screen(universe, expression)
+
+
+def test_missing_values_never_match(universe):
+    result = screen(universe, "lag(roe, 5) > 0 or growth(roe, 1) > 0")
+
+    assert result["symbol"].tolist() == ["ACB", "FPT"]
+
+
+def test_industry_table_from_icb_levels():
+    listing = pd.DataFrame(
+        {
+            "symbol": ["ACB", "ACB", "ACB", "FPT", "FPT"],
+            "icb_level": [1, 2, 3, 1, 2],
+            "icb_name": ["Financials", "Banks", "Banks", "Technology", "Technology"],
+        }
+    )
+
+    table = industry_table(listing)
+
+    assert table.to_dict("records") == [
+        {"symbol": "ACB", "industry": "Banks"},
+        {"symbol": "FPT", "industry": "Technology"},
+    ]
+
+
+def test_filter_by_industry(universe):
+    result = screen(universe, 'industry == "banks" and roe > 0.18')
+
+    assert result["symbol"].tolist() == ["ACB"]
+    assert result["industry"].tolist() == ["Banks"]
+
+
+@pytest.mark.parametrize(
+    "expression, symbols",
+    [
+        ('industry != "Banks"', ["FPT", "HPG"]),
+        ('industry in ("Banks", "Technology")', ["ACB", "FPT"]),
+        ('industry not in ["Banks"] and roe > 0.2', ["FPT"]),
+    ],
+)
+def test_industry_comparisons(universe, expression, symbols):
+    assert screen(universe, expression)["symbol"].tolist() == symbols
+
+
+@pytest.mark.parametrize(
+    "expression", ["industry", 'industry > "Banks"', "industry == 1"]
+)
+def test_industry_needs_name_comparison(universe, expression):
+    with pytest.raises(ScreenerError):
+        screen(universe, expression)
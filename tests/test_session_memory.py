@@ -0,0 +1,161 @@
+"""Session memory budget tests with a controlled clock and plain dict states"""
+
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+from pandasai import Agent
+
+import session_memory
+from model_router import create_llm
+from session_memory import SessionMemoryManager, estimate_size, session_size
+
+IDLE_SECONDS = 100
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(session_memory, "time", clock)
+    return clock
+
+
+def frame(rows=10000):
+    return pd.DataFrame({"close": np.arange(rows, dtype="float64")})
+
+
+def make_state():
+    return {
+        "dataframes": {"PriceHistory": frame()},
+        "messages": [{"role": "user", "content": "What's the ROE in 2024?"}],
+        "agent": object(),
+        "agent_key": "agent_1_0",
+    }
+
+
+@pytest.fixture
+def sessions(clock, tmp_path):
+    """Manager with room for two of three sessions, tracked at t=0, 10, 20"""
+    closed = set()
+    session_bytes = session_size(make_state())
+    manager = SessionMemoryManager(
+        int(session_bytes * 2.5),
+        str(tmp_path / "sessions"),
+        IDLE_SECONDS,
+        is_active=lambda session_id: session_id not in closed,
+    )
+    states = {}
+    for session_id in ("a", "b", "c"):
+        states[session_id] = make_state()
+        manager.track(session_id, states[session_id])
+        clock.now += 10
+    return manager, states, closed
+
+
+def spill_path(manager, session_id):
+    return os.path.join(manager.spill_dir, f"{session_id}.pkl")
+
+
+def test_evicts_least_recently_active_idle_session(sessions, clock):
+    manager, states, closed = sessions
+    states["d"] = make_state()
+
+    clock.now = 200
+    manager.track("d", states["d"])
+
+    # The two oldest sessions are spilled to get back under budget
+    for session_id in ("a", "b"):
+        assert "dataframes" not in states[session_id]
+        assert "agent" not in states[session_id]
+        assert "agent_key" not in states[session_id]
+        assert os.path.exists(spill_path(manager, session_id))
+    assert "dataframes" in states["c"] and "dataframes" in states["d"]
+    assert not os.path.exists(spill_path(manager, "c"))
+
+
+def test_sessions_active_within_idle_seconds_are_not_evicted(sessions, clock):
+    manager, states, closed = sessions
+    states["d"] = make_state()
+
+    clock.now = 50
+    manager.track("d", states["d"])
+
+    # Over budget, but every other session was active in the last 100 seconds
+    assert all("dataframes" in state for state in states.values())
+    assert manager.stats()["evictions"] == 0
+
+
+def test_rehydration_restores_heavy_keys(sessions, clock):
+    manager, states, closed = sessions
+    original = states["a"]["dataframes"]["PriceHistory"].copy()
+    clock.now = 200
+    manager.track("c", states["c"])
+    assert os.path.exists(spill_path(manager, "a"))
+
+    manager.track("a", states["a"])
+
+    assert states["a"]["dataframes"]["PriceHistory"].equals(original)
+    assert states["a"]["messages"][0]["content"] == "What's the ROE in 2024?"
+    # The agent can't be pickled and is rebuilt on the next question
+    assert "agent" not in states["a"]
+    assert not os.path.exists(spill_path(manager, "a"))
+    assert manager.stats()["rehydrations"] == 1
+
+
+def test_closed_sessions_are_forgotten(sessions, clock):
+    manager, states, closed = sessions
+    clock.now = 200
+    manager.track("c", states["c"])
+    assert os.path.exists(spill_path(manager, "a"))
+
+    closed.update({"a", "b"})
+    manager.track("c", states["c"])
+
+    stats = manager.stats()
+    assert stats["resident_sessions"] == 1
+    assert stats["spilled_sessions"] == 0
+    assert not os.path.exists(spill_path(manager, "a"))
+
+
+def test_stats(sessions, clock):
+    manager, states, closed = sessions
+    clock.now = 200
+    manager.track("c", states["c"])
+
+    stats = manager.stats()
+
+    assert stats["resident_sessions"] == 2
+    assert stats["spilled_sessions"] == 1
+    assert stats["evictions"] == 1
+    assert stats["rehydrations"] == 0
+    assert stats["resident_mb"] == round(2 * session_size(make_state()) / 1024**2, 1)
+    assert stats["budget_mb"] == round(manager.budget_bytes / 1024**2, 1)
+
+
+def test_session_size_counts_agent_dataframes_once(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    prices = frame()
+    state = {"dataframes": {"PriceHistory": prices}}
+    without_agent = session_size(state)
+
+    state["agent"] = Agent(
+        [prices],
+        config={
+            "llm": create_llm("sk-test", "gpt-4o-mini"),
+            "enable_cache": False,
+            "save_logs": False,
+        },
+    )
+    state["agent"].context.memory.add("How many rows are there?", True)
+
+    extra = session_size(state) - without_agent
+    assert 0 < extra < estimate_size(prices)
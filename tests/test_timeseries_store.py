@@ -0,0 +1,86 @@
+"""Append-only time-series store tests in a temporary directory"""
+
+import pandas as pd
+import pytest
+
+import timeseries_store
+from core import sync_series
+from timeseries_store import TimeSeriesStore
+
+
+@pytest.fixture
+def store(monkeypatch, tmp_path):
+    store = TimeSeriesStore(str(tmp_path))
+    monkeypatch.setattr(timeseries_store, "_store", store)
+    return store
+
+
+def prices(dates, close):
+    return pd.DataFrame({"time": dates, "close": close})
+
+
+def test_append_keeps_only_newer_rows(store):
+    old = prices(["2024-01-02", "2024-01-03"], [1, 2])
+    assert store.append("prices", "ree", old, "time") == 2
+
+    # Older and equal keys, duplicates and unparseable dates are dropped
+    new = prices(
+        ["2024-01-01", "2024-01-03", "2024-01-04", "2024-01-04", "not a date"],
+        [0, 9, 3, 4, 5],
+    )
+    assert store.append("prices", "REE", new, "time") == 1
+
+    series = store.read("prices", "REE")
+    assert series["time"].tolist() == list(
+        pd.to_datetime(["2024-01-02", "2024-01-03", "2024-01-04"])
+    )
+    assert series["close"].tolist() == [1, 2, 4]
+    assert store.last_key("prices", "REE", "time") == pd.Timestamp("2024-01-04")
+
+
+def test_empty_series(store):
+    assert store.read("prices", "REE").empty
+    assert store.last_key("prices", "REE", "time") is None
+    assert store.append("prices", "REE", pd.DataFrame(), "time") == 0
+
+
+def test_compacts_past_max_parts(store, monkeypatch):
+    monkeypatch.setattr(timeseries_store, "MAX_PARTS", 3)
+    dates = pd.date_range("2024-01-01", periods=5).strftime("%Y-%m-%d")
+
+    for i, day in enumerate(dates):
+        store.append("prices", "REE", prices([day], [i]), "time")
+
+    # The fourth append compacts to one part, the fifth adds a second
+    parts = store._parts("prices", "REE")
+    assert len(parts) == 2
+    assert parts[-1].endswith("part-000004.arrow")
+    assert store.read("prices", "REE")["close"].tolist() == [0, 1, 2, 3, 4]
+
+
+def test_sync_series_checks_upstream_once_per_day(store):
+    fetched = []
+
+    def fetch_new(last):
+        fetched.append(last)
+        return prices(["2024-01-02"], [1])
+
+    first = sync_series("prices", "REE", "time", fetch_new)
+    second = sync_series("prices", "REE", "time", fetch_new)
+
+    assert fetched == [None]
+    assert store.synced_today("prices", "REE")
+    assert first.equals(second)
+
+
+def test_sync_series_serves_stored_rows_when_update_fails(store):
+    store.append("prices", "REE", prices(["2024-01-02"], [1]), "time")
+
+    def fetch_new(last):
+        raise ConnectionError("upstream down")
+
+    series = sync_series("prices", "REE", "time", fetch_new)
+
+    assert series["close"].tolist() == [1]
+    # A failed update is retried on the next load rather than marked synced
+    assert not store.synced_today("prices", "REE")
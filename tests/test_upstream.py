@@ -0,0 +1,217 @@
+"""Upstream client tests: retries, vnstock's SystemExit rate limit, coalescing"""
+
+import threading
+import time
+
+import pytest
+import requests
+
+from upstream import (
+    TokenBucket,
+    UpstreamClient,
+    UpstreamRateLimitError,
+    is_rate_limited,
+    is_retryable_error,
+)
+
+VNAI_RATE_LIMIT = "Rate limit exceeded. Try again in 60 seconds. Process terminated."
+
+
+def make_client(**kwargs):
+    kwargs.setdefault("base_delay", 0.001)
+    kwargs.setdefault("max_delay", 0.001)
+    return UpstreamClient(60000, **kwargs)
+
+
+def http_error(status):
+    response = requests.Response()
+    response.status_code = status
+    return requests.HTTPError(f"{status} error", response=response)
+
+
+class Upstream:
+    """Callable that raises the queued errors, then returns ``result``"""
+
+    def __init__(self, *errors, result="data"):
+        self.errors = list(errors)
+        self.result = result
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return self.result
+
+
+@pytest.mark.parametrize(
+    "error, expected",
+    [
+        (RuntimeError("Too Many Requests"), True),
+        (RuntimeError("Error code: 429 - quota"), True),
+        (SystemExit(VNAI_RATE_LIMIT), True),
+        (RuntimeError("Symbol not found"), False),
+        (SystemExit(1), False),
+    ],
+)
+def test_is_rate_limited(error, expected):
+    assert is_rate_limited(error) is expected
+
+
+@pytest.mark.parametrize(
+    "error, expected",
+    [
+        (requests.ConnectionError("connection reset"), True),
+        (requests.Timeout("read timed out"), True),
+        (TimeoutError(), True),
+        (ConnectionRefusedError(), True),
+        (http_error(503), True),
+        (http_error(429), True),
+        (http_error(404), False),
+        (http_error(400), False),
+        (FileNotFoundError("missing.csv"), False),
+        (ValueError("bad period"), False),
+    ],
+)
+def test_is_retryable_error(error, expected):
+    assert is_retryable_error(error) is expected
+
+
+def test_vnstock_system_exit_is_throttled_and_retried():
+    client = make_client()
+    fn = Upstream(SystemExit(VNAI_RATE_LIMIT))
+
+    assert client.call("ratio:REE", fn) == "data"
+
+    stats = client.stats()
+    assert fn.calls == 2
+    assert stats["throttled"] == 1
+    assert stats["retries"] == 1
+    assert stats["rate_per_minute"] < stats["limit_per_minute"]
+
+
+def test_vnstock_system_exit_becomes_exception_when_retries_run_out():
+    client = make_client(max_retries=2)
+    fn = Upstream(*[SystemExit(VNAI_RATE_LIMIT)] * 3)
+
+    with pytest.raises(UpstreamRateLimitError, match="Rate limit exceeded"):
+        client.call("ratio:REE", fn)
+    assert fn.calls == 3
+    assert client.stats()["errors"] == 1
+
+
+def test_other_system_exit_is_not_caught():
+    client = make_client()
+    fn = Upstream(SystemExit(2))
+
+    with pytest.raises(SystemExit):
+        client.call("ratio:REE", fn)
+    assert fn.calls == 1
+
+
+def test_client_errors_are_not_retried():
+    client = make_client()
+    fn = Upstream(http_error(404))
+
+    with pytest.raises(requests.HTTPError):
+        client.call("ratio:XYZ", fn)
+    assert fn.calls == 1
+    assert client.stats()["retries"] == 0
+
+
+def test_server_errors_are_retried():
+    client = make_client()
+    fn = Upstream(http_error(502), requests.ConnectionError())
+
+    assert client.call("ratio:REE", fn) == "data"
+    assert fn.calls == 3
+    assert client.stats()["throttled"] == 0
+
+
+def test_concurrent_identical_calls_share_one_upstream_call():
+    client = make_client()
+    release = threading.Event()
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        release.wait(5)
+        return object()
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(client.call("ratio:REE", fetch)))
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    # Let every caller join the flight before the upstream call returns
+    deadline = time.monotonic() + 5
+    while client.stats()["calls"] < 8 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(calls) == 1
+    assert len(results) == 8
+    assert all(result is results[0] for result in results)
+    assert client.stats()["coalesced"] == 7
+    assert client.stats()["in_flight"] == 0
+
+
+def test_coalesced_callers_receive_the_leaders_error():
+    client = make_client(max_retries=0)
+    release = threading.Event()
+
+    def fetch():
+        release.wait(5)
+        raise SystemExit(VNAI_RATE_LIMIT)
+
+    errors = []
+
+    def call():
+        try:
+            client.call("ratio:REE", fetch)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    deadline = time.monotonic() + 5
+    while client.stats()["calls"] < 3 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(errors) == 3
+    assert all(isinstance(e, UpstreamRateLimitError) for e in errors)
+
+
+def test_token_bucket_throttle_and_recover():
+    bucket = TokenBucket(60)
+    assert bucket.rate == pytest.approx(1.0)
+
+    bucket.throttle()
+    assert bucket.rate == pytest.approx(0.5)
+    for _ in range(5):
+        bucket.throttle()
+    assert bucket.rate == pytest.approx(bucket.min_rate)
+
+    bucket.recover()
+    assert bucket.rate == pytest.approx(bucket.min_rate + bucket.base_rate / 20)
+    for _ in range(100):
+        bucket.recover()
+    assert bucket.rate == pytest.approx(bucket.base_rate)
+
+
+def test_token_bucket_waits_once_empty():
+    bucket = TokenBucket(600, capacity=2)
+
+    assert bucket.acquire() == 0
+    assert bucket.acquire() == 0
+    bucket.throttle()
+    # Throttling empties the bucket and halves the rate to 5 per second
+    assert bucket.acquire() == pytest.approx(0.2, rel=0.5)
@@ -0,0 +1,162 @@
+"""
+Append-only columnar time-series store for per-symbol price and dividend data.
+
+Each (dataset, symbol) is a directory of Arrow IPC files:
+
+    data/timeseries/<dataset>/<symbol>/part-000000.arrow
+                                       part-000001.arrow
+                                       ...
+                                       synced
+
+Appends only ever add a new part holding rows newer than the last stored key,
+so refreshing a symbol downloads just the missing dates. Reads memory-map the
+parts rather than loading the files, and the DataFrame is the only in-memory
+copy: conversion releases each Arrow column as soon as it has been converted.
+Once a series grows past ``MAX_PARTS`` parts they are compacted into a single
+part. ``synced`` records the last date the series was checked upstream so a
+symbol is refreshed at most once per day.
+"""
+
+import os
+import glob
+import threading
+from datetime import date
+
+import pandas as pd
+import pyarrow as pa
+
+from config import get_data_dir
+
+MAX_PARTS = 32
+
+
+class TimeSeriesStore:
+    """Append-only Arrow store keyed by a date column"""
+
+    def __init__(self, root):
+        self.root = root
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+
+    def _series_dir(self, dataset, symbol):
+        return os.path.join(self.root, dataset, symbol.upper())
+
+    def _parts(self, dataset, symbol):
+        return sorted(
+            glob.glob(os.path.join(self._series_dir(dataset, symbol), "part-*.arrow"))
+        )
+
+    def lock(self, dataset, symbol):
+        """Per-series lock so concurrent sessions don't append the same rows"""
+        key = (dataset, symbol.upper())
+        with self._locks_lock:
+            if key not in self._locks:
+                self._locks[key] = threading.Lock()
+            return self._locks[key]
+
+    @staticmethod
+    def _read_part(path):
+        with pa.memory_map(path, "r") as source:
+            return pa.ipc.open_file(source).read_all()
+
+    @staticmethod
+    def _write_part(path, table):
+        tmp_path = path + ".tmp"
+        with pa.OSFile(tmp_path, "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(tmp_path, path)
+
+    def read(self, dataset, symbol):
+        """Read the full series as a DataFrame (empty if nothing is stored)"""
+        parts = self._parts(dataset, symbol)
+        if not parts:
+            return pd.DataFrame()
+        tables = [self._read_part(path) for path in parts]
+        table = pa.concat_tables(tables, promote_options="permissive")
+        # Free each column's Arrow buffers as it is converted instead of
+        # holding the Arrow table and the DataFrame at once
+        return table.to_pandas(split_blocks=True, self_destruct=True)
+
+    def last_key(self, dataset, symbol, key):
+        """Latest stored value of the key column, or None for an empty series"""
+        parts = self._parts(dataset, symbol)
+        if not parts:
+            return None
+        # Parts hold strictly increasing keys, so the last part has the maximum
+        column = self._read_part(parts[-1]).column(key).to_pandas()
+        return column.max() if len(column) else None
+
+    def append(self, dataset, symbol, df, key):
+        """
+        Append rows whose key is newer than anything stored.
+        Returns the number of rows written.
+        """
+        if df is None or df.empty or key not in df.columns:
+            return 0
+
+        df = df.copy()
+        # Rows without a parseable key can't be ordered against later appends
+        df[key] = pd.to_datetime(df[key], errors="coerce")
+        df = df[df[key].notna()]
+        last = self.last_key(dataset, symbol, key)
+        if last is not None:
+            df = df[df[key] > last]
+        if df.empty:
+            return 0
+        df = df.sort_values(key).drop_duplicates(subset=key, keep="last")
+
+        series_dir = self._series_dir(dataset, symbol)
+        os.makedirs(series_dir, exist_ok=True)
+        parts = self._parts(dataset, symbol)
+        next_index = (
+            int(os.path.basename(parts[-1])[5:11]) + 1 if parts else 0
+        )
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        self._write_part(
+            os.path.join(series_dir, f"part-{next_index:06d}.arrow"), table
+        )
+
+        if len(parts) + 1 > MAX_PARTS:
+            self.compact(dataset, symbol)
+        return len(df)
+
+    def compact(self, dataset, symbol):
+        """Merge all parts of a series into a single part"""
+        parts = self._parts(dataset, symbol)
+        if len(parts) < 2:
+            return
+        tables = [self._read_part(path) for path in parts]
+        table = pa.concat_tables(tables, promote_options="permissive")
+        # Write over the newest part name so appends keep increasing indices
+        self._write_part(parts[-1], table)
+        for path in parts[:-1]:
+            os.remove(path)
+
+    def synced_today(self, dataset, symbol):
+        """Whether the series was already refreshed upstream today"""
+        path = os.path.join(self._series_dir(dataset, symbol), "synced")
+        try:
+            with open(path) as f:
+                return f.read().strip() == date.today().isoformat()
+        except OSError:
+            return False
+
+    def mark_synced(self, dataset, symbol):
+        series_dir = self._series_dir(dataset, symbol)
+        os.makedirs(series_dir, exist_ok=True)
+        with open(os.path.join(series_dir, "synced"), "w") as f:
+            f.write(date.today().isoformat())
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_timeseries_store():
+    """Return the process-wide store under $FINBRO_DATA_DIR/timeseries"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = TimeSeriesStore(os.path.join(get_data_dir(), "timeseries"))
+        return _store
@@ -0,0 +1,271 @@
+"""
+Upstream client layer for vnstock calls.
+
+Every ``stock.finance.*`` call goes through a process-wide ``UpstreamClient``
+shared by all Streamlit sessions (and batch workers), which:
+
+- coalesces identical in-flight requests into one upstream call (single-flight),
+- paces calls with a token bucket sized to the vnstock tier (guest vs registered
+  via ``VNSTOCK_API_KEY``) that slows down when vnstock reports a rate limit and
+  recovers gradually on success,
+- retries rate-limited calls, connection errors, timeouts and 5xx responses
+  with jittered backoff.
+
+vnstock reports its own quota (via vnai) by calling ``sys.exit()``; that
+``SystemExit`` is treated as a rate limit and, once retries run out, raised as
+``UpstreamRateLimitError`` so callers' ``except Exception`` handlers see it.
+
+Coalesced callers receive the same result object, so returned dataframes must be
+treated as read-only (copy before modifying).
+"""
+
+import os
+import re
+import time
+import random
+import threading
+
+import requests
+
+# vnstock request limits per minute by tier
+GUEST_REQUESTS_PER_MINUTE = 20
+REGISTERED_REQUESTS_PER_MINUTE = 60
+
+# Rate limit wording, or a 429 given as an HTTP status / error code, in an
+# exception name or message (vnstock, requests and OpenAI errors)
+RATE_LIMIT_PATTERN = re.compile(
+    r"ratelimit|rate[ _]limit|too many requests|giới hạn"
+    r"|\b(?:error code|status code|status|http(?: error)?)\s*[:=]?\s*429\b",
+    re.IGNORECASE,
+)
+
+# Network failures worth retrying (requests' and the standard library's)
+TRANSIENT_ERRORS = (
+    requests.ConnectionError,
+    requests.Timeout,
+    ConnectionError,
+    TimeoutError,
+)
+
+
+def _status_code(error):
+    """HTTP status of an OpenAI-style or requests error, if it carries one"""
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status
+
+
+def is_rate_limited(error):
+    """Check whether an exception or error message reports a rate limit"""
+    if _status_code(error) == 429:
+        return True
+    if isinstance(error, BaseException):
+        text = f"{type(error).__name__} {error}"
+    else:
+        text = str(error)
+    return RATE_LIMIT_PATTERN.search(text) is not None
+
+
+class UpstreamRateLimitError(RuntimeError):
+    """vnstock's rate limit, which vnai reports by raising SystemExit"""
+
+
+def is_retryable_error(error):
+    """Rate limits, connection errors, timeouts and 5xx responses are transient"""
+    if is_rate_limited(error):
+        return True
+    # requests errors subclass OSError, but a 404 or a bad parameter is final
+    if isinstance(error, TRANSIENT_ERRORS):
+        return True
+    status = _status_code(error)
+    return isinstance(status, int) and status >= 500
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket with adaptive refill rate.
+    ``throttle()`` halves the rate (down to a floor) after a rate limit error and
+    ``recover()`` steps it back towards the configured rate after successes.
+    """
+
+    def __init__(self, requests_per_minute, capacity=None):
+        self.base_rate = requests_per_minute / 60.0
+        self.min_rate = self.base_rate / 4
+        self.rate = self.base_rate
+        self.capacity = capacity or max(1, requests_per_minute // 4)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(
+            self.capacity, self._tokens + (now - self._updated) * self.rate
+        )
+        self._updated = now
+
+    def acquire(self):
+        """Block until a token is available. Returns seconds spent waiting."""
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
+
+    def throttle(self):
+        with self._lock:
+            self._refill()
+            self.rate = max(self.min_rate, self.rate / 2)
+            self._tokens = 0.0
+
+    def recover(self):
+        with self._lock:
+            self._refill()
+            self.rate = min(self.base_rate, self.rate + self.base_rate / 20)
+
+
+class _Flight:
+    """An upstream call in progress that other callers can wait on"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class UpstreamClient:
+    """Rate-limited, coalescing, retrying gateway for upstream data calls"""
+
+    def __init__(
+        self, requests_per_minute, max_retries=3, base_delay=1.0, max_delay=30.0
+    ):
+        self.requests_per_minute = requests_per_minute
+        self.bucket = TokenBucket(requests_per_minute)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._flights = {}
+        self._lock = threading.Lock()
+        self._queue_depth = 0
+        self._counters = {
+            "calls": 0,
+            "upstream_calls": 0,
+            "coalesced": 0,
+            "throttled": 0,
+            "retries": 0,
+            "errors": 0,
+            "wait_seconds": 0.0,
+        }
+
+    def _count(self, name, value=1):
+        with self._lock:
+            self._counters[name] += value
+
+    def call(self, key, fn, *args, **kwargs):
+        """
+        Call ``fn(*args, **kwargs)`` upstream, sharing the result with any
+        concurrent caller using the same ``key``. The key must identify the
+        request completely (endpoint, symbol, source and parameters).
+        """
+        with self._lock:
+            self._counters["calls"] += 1
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+            else:
+                self._counters["coalesced"] += 1
+
+        if leader:
+            try:
+                flight.result = self._call_with_retry(fn, *args, **kwargs)
+            except BaseException as e:
+                flight.error = e
+            finally:
+                with self._lock:
+                    del self._flights[key]
+                flight.done.set()
+        else:
+            flight.done.wait()
+
+        if flight.error is not None:
+            raise flight.error
+        return flight.result
+
+    def _call_with_retry(self, fn, *args, **kwargs):
+        for attempt in range(self.max_retries + 1):
+            with self._lock:
+                self._queue_depth += 1
+            try:
+                waited = self.bucket.acquire()
+            finally:
+                with self._lock:
+                    self._queue_depth -= 1
+            self._count("wait_seconds", waited)
+            self._count("upstream_calls")
+
+            try:
+                result = fn(*args, **kwargs)
+            except SystemExit as e:
+                if not is_rate_limited(e):
+                    raise
+                error = UpstreamRateLimitError(str(e.code))
+                error.__cause__ = e
+            except Exception as e:
+                error = e
+            else:
+                self.bucket.recover()
+                return result
+
+            if is_rate_limited(error):
+                self._count("throttled")
+                self.bucket.throttle()
+            if not is_retryable_error(error) or attempt == self.max_retries:
+                self._count("errors")
+                raise error
+            self._count("retries")
+            # Full jitter so waiting sessions don't retry in lockstep
+            delay = min(self.max_delay, self.base_delay * (2**attempt))
+            time.sleep(random.uniform(0, delay))
+
+    def stats(self):
+        """Snapshot of queue depth, throttle counts and current pacing"""
+        with self._lock:
+            stats = dict(self._counters)
+            stats["queue_depth"] = self._queue_depth
+            stats["in_flight"] = len(self._flights)
+        stats["wait_seconds"] = round(stats["wait_seconds"], 2)
+        stats["rate_per_minute"] = round(self.bucket.rate * 60, 1)
+        stats["limit_per_minute"] = self.requests_per_minute
+        return stats
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def requests_per_minute_limit():
+    """
+    vnstock request limit: the tier implied by VNSTOCK_API_KEY unless
+    overridden with VNSTOCK_REQUESTS_PER_MINUTE
+    """
+    if os.environ.get("VNSTOCK_API_KEY", ""):
+        default_limit = REGISTERED_REQUESTS_PER_MINUTE
+    else:
+        default_limit = GUEST_REQUESTS_PER_MINUTE
+    return int(os.environ.get("VNSTOCK_REQUESTS_PER_MINUTE", default_limit))
+
+
+def get_upstream_client():
+    """Return the process-wide upstream client paced at the configured limit"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = UpstreamClient(requests_per_minute_limit())
+        return _client